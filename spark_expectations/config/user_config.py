@@ -42,7 +42,15 @@ class Constants:
         "spark.expectations.notifications.error.drop.threshold"
     )
 
+    se_use_checkpoint_for_plan_break = (
+        "spark.expectations.use.checkpoint.for.plan.break"
+    )
+    se_skip_empty_dataframe = "spark.expectations.skip.empty.dataframe"
+    se_enable_concurrent_source_dq = "spark.expectations.concurrent.source.dq"
+
     se_enable_streaming = "se.enable.streaming"
+    se_buffer_stats_writes = "se.streaming.buffer.stats.writes"
+    se_buffer_stats_writes_size = "se.streaming.buffer.stats.writes.size"
 
     secret_type = "se.streaming.secret.type"
 
@@ -4,12 +4,40 @@ from datetime import timezone
 from datetime import datetime
 from dataclasses import dataclass
 from uuid import uuid1
-from typing import Dict, Optional, List
+from typing import Any, Dict, Optional, List
 from pyspark.sql import DataFrame
 from spark_expectations.core import get_spark_session
 from spark_expectations.config.user_config import Constants as user_config
 from spark_expectations.core.exceptions import SparkExpectationsMiscException
 
+# default values of the per run state, which are reset at the start of every with_expectations run
+_DEFAULT_RUN_STATE: Dict[str, Any] = {
+    "_dq_run_status": "Failed",
+    "_source_agg_dq_status": "Skipped",
+    "_source_query_dq_status": "Skipped",
+    "_row_dq_status": "Skipped",
+    "_final_agg_dq_status": "Skipped",
+    "_final_query_dq_status": "Skipped",
+    "_input_count": 0,
+    "_error_count": 0,
+    "_output_count": 0,
+    "_source_agg_dq_result": None,
+    "_final_agg_dq_result": None,
+    "_source_query_dq_result": None,
+    "_final_query_dq_result": None,
+    "_summarised_row_dq_res": None,
+    "_source_agg_dq_start_time": None,
+    "_final_agg_dq_start_time": None,
+    "_source_query_dq_start_time": None,
+    "_final_query_dq_start_time": None,
+    "_row_dq_start_time": None,
+    "_source_agg_dq_end_time": None,
+    "_final_agg_dq_end_time": None,
+    "_source_query_dq_end_time": None,
+    "_final_query_dq_end_time": None,
+    "_row_dq_end_time": None,
+}
+
 
 # TODO: Add exceptions to follow standardized naming conventions for _run_id, product_id and _dq_stats_table_name in
 #       the future
@@ -1457,6 +1485,15 @@ class SparkExpectationsContext:
         """
         return self._summarised_row_dq_res
 
+    def reset_run_state(self) -> None:
+        """
+        This function resets the statuses, counts, results and timings of the previous run to the defaults
+        Returns:
+            None
+
+        """
+        self.__dict__.update(_DEFAULT_RUN_STATE)
+
     def set_rules_exceeds_threshold(self, rules: Optional[List[dict]] = None) -> None:
         """
         This function implements error percentage for each rule type
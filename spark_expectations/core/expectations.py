@@ -1,8 +1,11 @@
 import functools
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Dict, Optional, Any, Union
+from typing import Callable, Dict, List, Optional, Any, Tuple, TypeVar, Union
 
+from pyspark import StorageLevel
 from pyspark.sql import DataFrame
+from pyspark.sql.functions import lit
 
 from spark_expectations import _log
 from spark_expectations.config.user_config import Constants as user_config
@@ -23,6 +26,8 @@ from spark_expectations.utils.actions import SparkExpectationsActions
 from spark_expectations.utils.reader import SparkExpectationsReader
 from spark_expectations.utils.regulate_flow import SparkExpectationsRegulateFlow
 
+_T = TypeVar("_T")
+
 
 @dataclass
 class SparkExpectations:
@@ -39,25 +44,88 @@ class SparkExpectations:
         self.actions = SparkExpectationsActions()
         self._context = SparkExpectationsContext(product_id=self.product_id)
 
-        self._writer = SparkExpectationsWriter(
+        self._context.set_debugger_mode(self.debugger)
+
+    # below helpers are created on first access, so that instances which never run
+    # with_expectations don't pay for their construction
+
+    @functools.cached_property
+    def _writer(self) -> SparkExpectationsWriter:
+        return SparkExpectationsWriter(
             product_id=self.product_id, _context=self._context
         )
-        self._process = SparkExpectationsRegulateFlow(product_id=self.product_id)
-        self._notification: SparkExpectationsNotify = SparkExpectationsNotify(
+
+    @functools.cached_property
+    def _process(self) -> SparkExpectationsRegulateFlow:
+        return SparkExpectationsRegulateFlow(product_id=self.product_id)
+
+    @functools.cached_property
+    def _notification(self) -> SparkExpectationsNotify:
+        return SparkExpectationsNotify(
             product_id=self.product_id, _context=self._context
         )
-        self._statistics_decorator = SparkExpectationsCollectStatistics(
+
+    @functools.cached_property
+    def _statistics_decorator(self) -> SparkExpectationsCollectStatistics:
+        return SparkExpectationsCollectStatistics(
             product_id=self.product_id,
             _context=self._context,
             _writer=self._writer,
         )
 
-        self.reader = SparkExpectationsReader(
+    @functools.cached_property
+    def reader(self) -> SparkExpectationsReader:
+        return SparkExpectationsReader(
             product_id=self.product_id,
             _context=self._context,
         )
 
-        self._context.set_debugger_mode(self.debugger)
+    def _run_in_scheduler_pool(self, pool: str, func: Callable[[], _T]) -> _T:
+        """
+        This function runs the given function with the spark jobs of the current thread assigned to a scheduler pool
+
+        Args:
+            pool: Provide the name of the spark scheduler pool
+            func: Provide the function which submits the spark jobs
+
+        Returns:
+            Any: The result of the function
+        """
+        self.spark.sparkContext.setLocalProperty("spark.scheduler.pool", pool)
+        try:
+            return func()
+        finally:
+            self.spark.sparkContext.setLocalProperty("spark.scheduler.pool", None)
+
+    def flush_stats_buffer(self) -> None:
+        """
+        This function writes the stats buffered with `se_buffer_stats_writes` into the kafka topic. It must be called
+        once the runs are over and before the spark session is stopped, as the buffered stats are not written otherwise
+
+        Returns:
+            None
+        """
+        self._writer.flush_stats_buffer()
+
+    @staticmethod
+    def _persist_for_run(df: DataFrame, to_unpersist: List[DataFrame]) -> None:
+        """
+        This function persists the dataframe for the run, unless it is already cached. A dataframe which is cached by
+        the caller (or shares the plan of a cached one) is left as it is, so that the run does not release its cache
+
+        Args:
+            df: Provide the dataframe which need to be persisted
+            to_unpersist: Provide the list of dataframes persisted by the run, which are unpersisted once it is over
+
+        Returns:
+            None
+        """
+        storage_level = df.storageLevel
+        if not (
+            storage_level.useMemory or storage_level.useDisk or storage_level.useOffHeap
+        ):
+            df.persist(StorageLevel.MEMORY_AND_DISK)
+            to_unpersist.append(df)
 
     def with_expectations(
         self,
@@ -78,7 +146,8 @@ class SparkExpectations:
             expectations: Dict of dict's with table and rules as keys
             write_to_table: Mark it as "True" if the dataframe need to be written as table
             write_to_temp_table: Mark it as "True" if the input dataframe need to be written to the temp table to break
-                                the spark plan
+                                the spark plan, set `se_use_checkpoint_for_plan_break` in spark_conf to break the
+                                plan with a local checkpoint instead of the temp table
             row_dq: Mark it as False to avoid row level expectation, by default is TRUE,
             agg_dq:  There are several dictionary variables that are used for data quality (DQ) aggregation in both the
             source and final DQ layers
@@ -197,58 +266,58 @@ class SparkExpectations:
             )
 
             _notification_on_start: bool = (
-                bool(_notification_dict[user_config.se_notifications_on_start])
-                if isinstance(
-                    _notification_dict[user_config.se_notifications_on_start],
-                    bool,
-                )
-                else False
+                _notification_dict.get(user_config.se_notifications_on_start) is True
             )
             _notification_on_completion: bool = (
-                bool(_notification_dict[user_config.se_notifications_on_completion])
-                if isinstance(
-                    _notification_dict[user_config.se_notifications_on_completion],
-                    bool,
-                )
-                else False
+                _notification_dict.get(user_config.se_notifications_on_completion)
+                is True
             )
             _notification_on_fail: bool = (
-                bool(_notification_dict[user_config.se_notifications_on_fail])
-                if isinstance(
-                    _notification_dict[user_config.se_notifications_on_fail],
-                    bool,
-                )
-                else False
+                _notification_dict.get(user_config.se_notifications_on_fail) is True
             )
             _notification_on_error_drop_exceeds_threshold_breach: bool = (
-                bool(
-                    _notification_dict[
-                        user_config.se_notifications_on_error_drop_exceeds_threshold_breach
-                    ]
+                _notification_dict.get(
+                    user_config.se_notifications_on_error_drop_exceeds_threshold_breach
                 )
-                if isinstance(
-                    _notification_dict[
-                        user_config.se_notifications_on_error_drop_exceeds_threshold_breach
-                    ],
-                    bool,
-                )
-                else False
+                is True
+            )
+            _error_drop_threshold_value = _notification_dict.get(
+                user_config.se_notifications_on_error_drop_threshold, 100
             )
             _error_drop_threshold: int = (
-                int(
-                    _notification_dict[
-                        user_config.se_notifications_on_error_drop_threshold
-                    ]
-                )
-                if isinstance(
-                    _notification_dict[
-                        user_config.se_notifications_on_error_drop_threshold
-                    ],
-                    int,
-                )
+                int(_error_drop_threshold_value)
+                if isinstance(_error_drop_threshold_value, int)
                 else 100
             )
 
+            _use_checkpoint_for_plan_break: bool = (
+                spark_conf.get(user_config.se_use_checkpoint_for_plan_break) is True
+                if spark_conf
+                else False
+            )
+
+            _concurrent_source_dq: bool = (
+                spark_conf.get(user_config.se_enable_concurrent_source_dq) is True
+                if spark_conf
+                else False
+            )
+
+            _skip_empty_dataframe: bool = (
+                spark_conf.get(user_config.se_skip_empty_dataframe) is True
+                if spark_conf
+                else False
+            )
+
+            # final agg dq evaluates the same rules as source agg dq, when every agg rule is
+            # enabled alike for source and target validation
+            _agg_rules_same_for_source_and_final: bool = all(
+                _rule.get("enable_for_source_dq_validation")
+                == _rule.get("enable_for_target_dq_validation")
+                for _rule in expectations.get(
+                    f"{self._context.get_agg_dq_rule_type_name}_rules", []
+                )
+            )
+
             self.reader.set_notification_param(spark_conf)
             self._context.set_notification_on_start(_notification_on_start)
             self._context.set_notification_on_completion(_notification_on_completion)
@@ -260,13 +329,15 @@ class SparkExpectations:
             @self._statistics_decorator.collect_stats_decorator
             @functools.wraps(func)
             def wrapper(*args: tuple, **kwargs: dict) -> DataFrame:
+                # dataframes persisted in this run, which are unpersisted once the run is over
+                _to_unpersist: List[DataFrame] = []
                 try:
                     _log.info("The function dataframe is getting created")
                     # _df: DataFrame = func(*args, **kwargs)
                     _df: DataFrame = func(*args, **kwargs)
                     table_name: str = self._context.get_table_name
 
-                    _input_count = _df.count()
+                    _input_count: int = 0
                     _output_count: int = 0
                     _error_count: int = 0
                     _source_dq_df: Optional[DataFrame] = None
@@ -274,56 +345,77 @@ class SparkExpectations:
                     _row_dq_df: Optional[DataFrame] = None
                     _final_dq_df: Optional[DataFrame] = None
                     _final_query_dq_df: Optional[DataFrame] = None
+                    _reuse_source_agg_dq_results: bool = False
 
-                    # initialize variable with default values through set
-                    self._context.set_dq_run_status()
-                    self._context.set_source_agg_dq_status()
-                    self._context.set_source_query_dq_status()
-                    self._context.set_row_dq_status()
-                    self._context.set_final_agg_dq_status()
-                    self._context.set_final_query_dq_status()
-                    self._context.set_input_count()
-                    self._context.set_error_count()
-                    self._context.set_output_count()
-                    self._context.set_source_agg_dq_result()
-                    self._context.set_final_agg_dq_result()
-                    self._context.set_source_query_dq_result()
-                    self._context.set_final_query_dq_result()
-                    self._context.set_summarised_row_dq_res()
-
-                    # initialize variables of start and end time with default values
-                    self._context._source_agg_dq_start_time = None
-                    self._context._final_agg_dq_start_time = None
-                    self._context._source_query_dq_start_time = None
-                    self._context._final_query_dq_start_time = None
-                    self._context._row_dq_start_time = None
-
-                    self._context._source_agg_dq_end_time = None
-                    self._context._final_agg_dq_end_time = None
-                    self._context._source_query_dq_end_time = None
-                    self._context._final_query_dq_end_time = None
-                    self._context._row_dq_end_time = None
-
-                    self._context.set_input_count(_input_count)
+                    # initialize the run state of the context with default values
+                    self._context.reset_run_state()
                     self._context.set_error_drop_threshold(_error_drop_threshold)
 
                     if isinstance(_df, DataFrame):
                         _log.info("The function dataframe is created")
                         self._context.set_table_name(table_name)
-                        if write_to_temp_table:
-                            _log.info("Dropping to temp table started")
-                            self.spark.sql(f"drop table if exists {table_name}_temp")
-                            _log.info("Dropping to temp table completed")
-                            _log.info("Writing to temp table started")
-                            self._writer.write_df_to_table(
-                                _df,
-                                f"{table_name}_temp",
-                                spark_conf=spark_conf,
-                                options=options,
+                        if write_to_temp_table and _use_checkpoint_for_plan_break:
+                            _log.info("Checkpointing the dataframe started")
+                            _df = _df.localCheckpoint(eager=True)
+                            _log.info("Checkpointing the dataframe completed")
+                        elif write_to_temp_table:
+                            if self._writer.supports_write_df_to_table_v2(options):
+                                _log.info("Writing to temp table started")
+                                # the temp table is created or replaced in a single call
+                                self._writer.write_df_to_table_v2(
+                                    _df,
+                                    f"{table_name}_temp",
+                                    spark_conf=spark_conf,
+                                    options=options,
+                                )
+                            else:
+                                _log.info("Dropping to temp table started")
+                                self.spark.sql(
+                                    f"drop table if exists {table_name}_temp"
+                                )
+                                _log.info("Dropping to temp table completed")
+                                _log.info("Writing to temp table started")
+                                self._writer.write_df_to_table(
+                                    _df,
+                                    f"{table_name}_temp",
+                                    spark_conf=spark_conf,
+                                    options=options,
+                                )
+                            _log.info("Writing to temp table completed")
+                            _df = self.spark.table(f"{table_name}_temp")
+
+                        # persist the dataframe, so that the input count and the dq runs below
+                        # reuse the materialized partitions instead of re-running the lineage
+                        if not (write_to_temp_table and _use_checkpoint_for_plan_break):
+                            self._persist_for_run(_df, _to_unpersist)
+                        _input_count = _df.count()
+                        self._context.set_input_count(_input_count)
+
+                        if _skip_empty_dataframe and _input_count == 0:
+                            # nothing to validate, so the data quality rules are not run on the empty dataframe
+                            _log.info(
+                                "The function dataframe is empty, skipping the data quality rules"
                             )
-                            _log.info("Read from temp table started")
-                            _df = self.spark.sql(f"select * from {table_name}_temp")
-                            _log.info("Read from temp table completed")
+                            if row_dq is not True:
+                                return None
+
+                            # the empty result carries the run id and run date columns, like the row dq result
+                            # of a non-empty dataframe
+                            _row_dq_df = _df.withColumn(
+                                self._context.get_run_id_name,
+                                lit(self._context.get_run_id),
+                            ).withColumn(
+                                self._context.get_run_date_name,
+                                lit(self._context.get_run_date),
+                            )
+                            if write_to_table:
+                                self._writer.write_df_to_table(
+                                    _row_dq_df,
+                                    f"{table_name}",
+                                    spark_conf=spark_conf,
+                                    options=options,
+                                )
+                            return _row_dq_df
 
                         func_process = self._process.execute_dq_process(
                             _context=self._context,
@@ -337,7 +429,9 @@ class SparkExpectations:
                             options_error_table=options_error_table,
                         )
 
-                        if _agg_dq is True and _source_agg_dq is True:
+                        def _run_source_agg_dq() -> (
+                            Tuple[DataFrame, Optional[List[Dict[str, str]]]]
+                        ):
                             _log.info(
                                 "started processing data quality rules for agg level expectations on soure dataframe"
                             )
@@ -348,12 +442,14 @@ class SparkExpectations:
                             #        _source_dq_df: applied data quality dataframe,
                             #        _dq_source_agg_results: source aggregation result in dictionary
                             #        _: place holder for error data at row level
+                            #        _: place holder for output count at row level
                             #        status: status of the execution
 
                             (
                                 _source_dq_df,
                                 _dq_source_agg_results,
                                 _,
+                                _,
                                 status,
                             ) = func_process(
                                 _df,
@@ -366,8 +462,11 @@ class SparkExpectations:
                             _log.info(
                                 "ended processing data quality rules for agg level expectations on source dataframe"
                             )
+                            return _source_dq_df, _dq_source_agg_results
 
-                        if _query_dq is True and _source_query_dq is True:
+                        def _run_source_query_dq() -> (
+                            Tuple[DataFrame, Optional[List[Dict[str, str]]]]
+                        ):
                             _log.info(
                                 "started processing data quality rules for query level expectations on soure dataframe"
                             )
@@ -378,12 +477,14 @@ class SparkExpectations:
                             #        _source_query_dq_df: applied data quality dataframe,
                             #        _dq_source_query_results: source query dq results in dictionary
                             #        _: place holder for error data at row level
+                            #        _: place holder for output count at row level
                             #        status: status of the execution
 
                             (
                                 _source_query_dq_df,
                                 _dq_source_query_results,
                                 _,
+                                _,
                                 status,
                             ) = func_process(
                                 _df,
@@ -395,6 +496,64 @@ class SparkExpectations:
                             _log.info(
                                 "ended processing data quality rules for query level expectations on source dataframe"
                             )
+                            return _source_query_dq_df, _dq_source_query_results
+
+                        _run_source_agg: bool = (
+                            _agg_dq is True and _source_agg_dq is True
+                        )
+                        _run_source_query: bool = (
+                            _query_dq is True and _source_query_dq is True
+                        )
+
+                        if (
+                            _concurrent_source_dq
+                            and _run_source_agg
+                            and _run_source_query
+                        ):
+                            # source agg dq and source query dq are independent of each other,
+                            # so they are submitted as concurrent spark jobs in their own scheduler pools. On
+                            # pyspark 3.2 and above the submitted functions inherit the local properties of this
+                            # thread (job group, description), and release their jvm thread once done in pinned
+                            # thread mode
+                            try:
+                                from pyspark import inheritable_thread_target
+                            except ImportError:
+                                # pyspark < 3.2
+                                inheritable_thread_target = None  # type: ignore
+
+                            def _source_dq_target(
+                                pool: str, func: Callable[[], Any]
+                            ) -> Callable[[], Any]:
+                                _target = functools.partial(
+                                    self._run_in_scheduler_pool, pool, func
+                                )
+                                if inheritable_thread_target is None:
+                                    return _target
+                                return inheritable_thread_target(_target)
+
+                            with ThreadPoolExecutor(max_workers=2) as _executor:
+                                _source_agg_future = _executor.submit(
+                                    _source_dq_target("dq_agg", _run_source_agg_dq)
+                                )
+                                _source_query_future = _executor.submit(
+                                    _source_dq_target("dq_query", _run_source_query_dq)
+                                )
+                                (
+                                    _source_dq_df,
+                                    _dq_source_agg_results,
+                                ) = _source_agg_future.result()
+                                (
+                                    _source_query_dq_df,
+                                    _,
+                                ) = _source_query_future.result()
+                        else:
+                            if _run_source_agg:
+                                (
+                                    _source_dq_df,
+                                    _dq_source_agg_results,
+                                ) = _run_source_agg_dq()
+                            if _run_source_query:
+                                _source_query_dq_df, _ = _run_source_query_dq()
 
                         if row_dq is True:
                             _log.info(
@@ -407,19 +566,40 @@ class SparkExpectations:
                             #        _row_dq_df: applied data quality dataframe at row level on raw dataframe,
                             #        _: place holder for aggregation
                             #        _error_count: number of error records
+                            #        _output_count: number of records in the row dq dataframe
                             #        status: status of the execution
-                            (_row_dq_df, _, _error_count, status) = func_process(
+                            (
+                                _row_dq_df,
+                                _,
+                                _error_count,
+                                _output_count,
+                                status,
+                            ) = func_process(
                                 _df,
                                 self._context.get_row_dq_rule_type_name,
                                 row_dq_flag=True,
                             )
                             self._context.set_error_count(_error_count)
+                            self._context.set_output_count(_output_count)
 
                             if _target_table_view:
                                 _row_dq_df.createOrReplaceTempView(_target_table_view)
 
-                            _output_count = _row_dq_df.count()
-                            self._context.set_output_count(_output_count)
+                            # row dq has not dropped any record, so the final agg dq reuses the source agg results
+                            _reuse_source_agg_dq_results = (
+                                _error_count == 0
+                                and _source_agg_dq is True
+                                and _agg_rules_same_for_source_and_final
+                            )
+
+                            # persist the row dq dataframe only when the final agg/query dq run on it besides the
+                            # final table write, a single consumer gains nothing from the cache
+                            if (
+                                _agg_dq is True
+                                and _final_agg_dq is True
+                                and not _reuse_source_agg_dq_results
+                            ) or (_query_dq is True and _final_query_dq is True):
+                                self._persist_for_run(_row_dq_df, _to_unpersist)
 
                             self._context.set_row_dq_status(status)
                             self._context.set_row_dq_end_time()
@@ -452,19 +632,34 @@ class SparkExpectations:
                             #        _final_dq_df: applied data quality dataframe at row level on raw dataframe,
                             #        _dq_final_agg_results: final agg dq result in dictionary
                             #        _: number of error records
+                            #        _: number of output records
                             #        status: status of the execution
-                            (
-                                _final_dq_df,
-                                _dq_final_agg_results,
-                                _,
-                                status,
-                            ) = func_process(
-                                _row_dq_df,
-                                self._context.get_agg_dq_rule_type_name,
-                                final_agg_dq_flag=True,
-                                error_count=_error_count,
-                                output_count=_output_count,
-                            )
+                            if _reuse_source_agg_dq_results:
+                                # row dq has not dropped any record, so the final dataframe holds
+                                # the same data as the source and the source agg results are reused
+                                _log.info(
+                                    "reusing the source agg dq results for the final dataframe"
+                                )
+                                _final_dq_df = _source_dq_df
+                                _dq_final_agg_results = _dq_source_agg_results
+                                self._context.set_final_agg_dq_result(
+                                    _dq_final_agg_results
+                                )
+                                status = self._context.get_source_agg_dq_status
+                            else:
+                                (
+                                    _final_dq_df,
+                                    _dq_final_agg_results,
+                                    _,
+                                    _,
+                                    status,
+                                ) = func_process(
+                                    _row_dq_df,
+                                    self._context.get_agg_dq_rule_type_name,
+                                    final_agg_dq_flag=True,
+                                    error_count=_error_count,
+                                    output_count=_output_count,
+                                )
                             self._context.set_final_agg_dq_status(status)
                             self._context.set_final_agg_dq_end_time()
                             _log.info(
@@ -486,11 +681,11 @@ class SparkExpectations:
                             #        _final_query_dq_df: applied data quality dataframe at row level on raw dataframe,
                             #        _dq_final_query_results: final query dq result in dictionary
                             #        _: number of error records
+                            #        _: number of output records
                             #        status: status of the execution
 
-                            if _target_table_view and _row_dq_df:
-                                _row_dq_df.createOrReplaceTempView(_target_table_view)
-                            else:
+                            # the target table view is registered once in the row dq step
+                            if not _target_table_view or _row_dq_df is None:
                                 raise SparkExpectationsMiscException(
                                     "final table view name is not supplied to run query dq"
                                 )
@@ -499,6 +694,7 @@ class SparkExpectations:
                                 _final_query_dq_df,
                                 _dq_final_query_results,
                                 _,
+                                _,
                                 status,
                             ) = func_process(
                                 _row_dq_df,
@@ -529,8 +725,6 @@ class SparkExpectations:
                             "error occurred while processing spark "
                             "expectations due to given dataframe is not type of dataframe"
                         )
-                    self.spark.catalog.clearCache()
-
                     return _row_dq_df
 
                 except Exception as e:
@@ -538,6 +732,11 @@ class SparkExpectations:
                         f"error occurred while processing spark expectations {e}"
                     )
 
+                finally:
+                    # only release the data cached by this run, instead of clearing the cache of the whole session
+                    for _persisted_df in _to_unpersist:
+                        _persisted_df.unpersist()
+
             return wrapper
 
         return _except
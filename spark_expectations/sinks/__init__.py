@@ -40,3 +40,9 @@ def get_sink_hook() -> pluggy.PluginManager:
 
 
 _sink_hook = get_sink_hook().hook
+
+# hook caller which writes only into the kafka topic, used to flush buffered stats
+_kafka_sink_hook = get_sink_hook().subset_hook_caller(
+    "writer",
+    remove_plugins=[get_sink_hook().get_plugin("spark_expectations_delta_write")],
+)
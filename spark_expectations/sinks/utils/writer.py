@@ -1,8 +1,11 @@
+import functools
 from dataclasses import dataclass
 from typing import Dict, Optional, Tuple, List, Any
 from datetime import datetime
+from pyspark import StorageLevel
 from pyspark.sql import DataFrame
 from pyspark.sql.functions import (
+    col,
     lit,
     expr,
     when,
@@ -11,6 +14,8 @@ from pyspark.sql.functions import (
     round as sql_round,
     create_map,
     explode,
+    first,
+    count as sql_count,
 )
 from spark_expectations import _log
 from spark_expectations.core.exceptions import (
@@ -21,9 +26,12 @@ from spark_expectations.core import get_spark_session
 from spark_expectations.secrets import SparkExpectationsSecretsBackend
 from spark_expectations.utils.udf import remove_empty_maps
 from spark_expectations.core.context import SparkExpectationsContext
-from spark_expectations.sinks import _sink_hook
+from spark_expectations.sinks import _sink_hook, _kafka_sink_hook
 from spark_expectations.config.user_config import Constants as user_config
 
+# table formats which support the DataFrameWriterV2 create or replace, when the session catalog is a v2 catalog
+_v2_table_formats = ["delta", "iceberg"]
+
 
 @dataclass
 class SparkExpectationsWriter:
@@ -36,6 +44,8 @@ class SparkExpectationsWriter:
 
     def __post_init__(self) -> None:
         self.spark = get_spark_session()
+        self._stats_buffer: List[DataFrame] = []
+        self._stats_buffer_kafka_write_options: Dict[str, str] = {}
 
     def save_df_as_table(
         self,
@@ -117,6 +127,100 @@ class SparkExpectationsWriter:
                 f"error occurred while saving the data into the table  {e}"
             )
 
+    def supports_write_df_to_table_v2(
+        self, options: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """
+        This function checks whether a table can be created or replaced with the DataFrameWriterV2 api, which needs
+        pyspark 3.1 or above, a v2 table format (delta by default) and a v2 session catalog
+
+        Args:
+            options: Provide the options which are used while writing the table
+
+        Returns:
+            bool: True if write_df_to_table_v2 can be used for the table, else False
+        """
+        _format = (options or {}).get("format", "delta")
+        return (
+            hasattr(DataFrame, "writeTo")
+            and _format in _v2_table_formats
+            and self.spark.conf.get("spark.sql.catalog.spark_catalog", None) is not None
+        )
+
+    def write_df_to_table_v2(
+        self,
+        df: DataFrame,
+        table: str,
+        spark_conf: Optional[Dict[str, Any]] = None,
+        options: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """
+        This function takes a dataframe and writes it into a table with the DataFrameWriterV2 api, which creates or
+        replaces the table in a single call. The table format must support the v2 api, see
+        supports_write_df_to_table_v2
+
+        Args:
+            df: Provide a dataframe to write the records to a table.
+            table: Provide the full original table name into which the data need to be written to
+            spark_conf: Provide the spark conf, if you want to set/override the configuration
+            options: Provide the options, if you want to override the default.
+                    default options available are - {"format": "delta"}
+
+        Returns:
+            None:
+
+        """
+        try:
+            _spark_conf = (
+                {**{"spark.sql.session.timeZone": "Etc/UTC"}, **spark_conf}
+                if spark_conf
+                else {"spark.sql.session.timeZone": "Etc/UTC"}
+            )
+            for key, value in _spark_conf.items():
+                self.spark.conf.set(key, value)
+
+            _options = (
+                {**{"format": "delta"}, **options} if options else {"format": "delta"}
+            )
+            _format = _options.pop("format")
+            _options.pop("mode", None)
+            _partition_by = _options.pop("partitionBy", None)
+
+            _df = df.withColumn(
+                self._context.get_run_id_name, lit(f"{self._context.get_run_id}")
+            ).withColumn(
+                self._context.get_run_date_name,
+                to_timestamp(lit(f"{self._context.get_run_date}")),
+            )
+
+            _log.info("_write_df_to_table_v2 started")
+            _writer = (
+                _df.writeTo(table)
+                .using(_format)
+                .tableProperty("product_id", self.product_id)
+            )
+            for key, value in _options.items():
+                _writer = _writer.option(key, str(value))
+            if _partition_by:
+                _writer = _writer.partitionedBy(
+                    *[
+                        col(_column)
+                        for _column in (
+                            [_partition_by]
+                            if isinstance(_partition_by, str)
+                            else _partition_by
+                        )
+                    ]
+                )
+
+            _writer.createOrReplace()
+            _log.info("finished writing records to table: %s", table)
+
+        except Exception as e:
+            raise SparkExpectationsMiscException(
+                f"error occurred while saving the data into the table {e}"
+            )
+
     def write_error_stats(self) -> None:
         """
         This functions takes the stats table and write it into error table
@@ -338,18 +442,32 @@ class SparkExpectationsWriter:
                 )
             )
 
+            _buffer_stats_writes: bool = bool(
+                _se_stats_dict[user_config.se_enable_streaming]
+            ) and (_se_stats_dict.get(user_config.se_buffer_stats_writes) is True)
+
             _sink_hook.writer(
                 _write_args={
                     "product_id": self.product_id,
                     "enable_se_streaming": _se_stats_dict[
                         user_config.se_enable_streaming
-                    ],
+                    ]
+                    and not _buffer_stats_writes,
                     "table_name": self._context.get_dq_stats_table_name,
                     "kafka_write_options": kafka_write_options,
                     "stats_df": df,
                 }
             )
 
+            if _buffer_stats_writes:
+                self.buffer_stats(
+                    df,
+                    kafka_write_options,
+                    int(
+                        _se_stats_dict.get(user_config.se_buffer_stats_writes_size, 10)
+                    ),
+                )
+
             _log.info(
                 "Writing metrics to the stats table: %s, ended",
                 self._context.get_dq_stats_table_name,
@@ -360,6 +478,70 @@ class SparkExpectationsWriter:
                 f"error occurred while saving the data into the stats table {e}"
             )
 
+    def buffer_stats(
+        self,
+        df: DataFrame,
+        kafka_write_options: Dict[str, str],
+        buffer_size: int = 10,
+    ) -> None:
+        """
+        This function buffers the stats dataframe of a run, which will be written into the kafka topic along with
+        the stats of other runs once the buffer is full or flush_stats_buffer is called. Buffered stats are not
+        written on their own when the process exits, the caller has to call flush_stats_buffer once the runs are over
+
+        Args:
+            df: Provide the stats dataframe of the run
+            kafka_write_options: Provide the options to write into the kafka topic
+            buffer_size: Provide the number of runs to be buffered before writing into the kafka topic
+
+        Returns:
+            None:
+
+        """
+        self._stats_buffer.append(df)
+        self._stats_buffer_kafka_write_options = kafka_write_options
+
+        if len(self._stats_buffer) >= buffer_size:
+            self.flush_stats_buffer()
+
+    def flush_stats_buffer(self) -> None:
+        """
+        This function writes the buffered stats into the kafka topic in a single batch
+
+        Returns:
+            None:
+
+        """
+        try:
+            if not self._stats_buffer:
+                return None
+
+            _log.info(
+                "Writing %s buffered stats records into the kafka topic, started",
+                len(self._stats_buffer),
+            )
+            stats_df = functools.reduce(DataFrame.unionByName, self._stats_buffer)
+
+            _kafka_sink_hook(
+                _write_args={
+                    "product_id": self.product_id,
+                    "enable_se_streaming": True,
+                    "kafka_write_options": {
+                        **self._stats_buffer_kafka_write_options,
+                        "kafka.linger.ms": "100",
+                        "kafka.batch.size": "64000",
+                    },
+                    "stats_df": stats_df.coalesce(1),
+                }
+            )
+            self._stats_buffer = []
+            _log.info("Writing buffered stats records into the kafka topic, ended")
+
+        except Exception as e:
+            raise SparkExpectationsMiscException(
+                f"error occurred while writing buffered stats into the kafka topic {e}"
+            )
+
     def write_error_records_final(
         self,
         df: DataFrame,
@@ -418,13 +600,19 @@ class SparkExpectationsWriter:
                 )
             )
             error_df = df.filter(f"size(meta_{rule_type}_results) != 0")
-            self._context.print_dataframe_with_debugger(error_df)
+            # the error records are materialized once for the table write, the error count
+            # and the summarised row dq results
+            error_df.persist(StorageLevel.MEMORY_AND_DISK)
+            try:
+                self._context.print_dataframe_with_debugger(error_df)
 
-            self.save_df_as_table(error_df, error_table, _spark_conf, _options)
+                self.save_df_as_table(error_df, error_table, _spark_conf, _options)
 
-            _error_count = error_df.count()
-            if _error_count > 0:
-                self.generate_summarised_row_dq_res(error_df, rule_type)
+                _error_count = error_df.count()
+                if _error_count > 0:
+                    self.generate_summarised_row_dq_res(error_df, rule_type)
+            finally:
+                error_df.unpersist()
 
             _log.info("_write_error_records_final ended")
             return _error_count, df
@@ -446,30 +634,24 @@ class SparkExpectationsWriter:
 
         """
         try:
-
-            def update_dict(accumulator: dict) -> dict:  # pragma: no cover
-                if accumulator.get("failed_row_count") is None:  # pragma: no cover
-                    accumulator["failed_row_count"] = str(2)  # pragma: no cover
-                else:  # pragma: no cover
-                    accumulator["failed_row_count"] = str(  # pragma: no cover
-                        int(accumulator["failed_row_count"]) + 1  # pragma: no cover
-                    )  # pragma: no cover
-
-                return accumulator  # pragma: no cover
-
-            summarised_row_dq_dict: Dict[str, Dict[str, str]] = (
+            # the failed rule results are aggregated in spark, so that only one row per rule
+            # is collected on the driver
+            summarised_row_dq_rows = (
                 df.select(explode(f"meta_{rule_type}_results").alias("row_dq_res"))
-                .rdd.map(
-                    lambda rule_meta_dict: (
-                        rule_meta_dict[0]["rule"],
-                        {**rule_meta_dict[0], "failed_row_count": 1},
-                    )
+                .groupBy(col("row_dq_res")["rule"].alias("rule"))
+                .agg(
+                    first("row_dq_res").alias("row_dq_res"),
+                    sql_count("*").alias("failed_row_count"),
                 )
-                .reduceByKey(lambda acc, itr: update_dict(acc))
-            ).collectAsMap()
+                .orderBy("rule")
+                .collect()
+            )
 
             self._context.set_summarised_row_dq_res(
-                list(summarised_row_dq_dict.values())
+                [
+                    {**row.row_dq_res, "failed_row_count": str(row.failed_row_count)}
+                    for row in summarised_row_dq_rows
+                ]
             )
 
         except Exception as e:
@@ -486,44 +668,35 @@ class SparkExpectationsWriter:
             None
         """
         try:
-            error_threshold_list = []
-            rules_failed_row_count: Dict[str, int] = {}
             if self._context.get_summarised_row_dq_res is None:
                 return None
 
-            rules_failed_row_count = {
+            rules_failed_row_count: Dict[str, int] = {
                 itr["rule"]: int(itr["failed_row_count"])
                 for itr in self._context.get_summarised_row_dq_res
             }
 
-            for rule in rules[f"{self._context.get_row_dq_rule_type_name}_rules"]:
-                # if (
-                #         not rule["enable_error_drop_alert"]
-                #         or rule["rule"] not in rules_failed_row_count.keys()
-                # ):
-                #     continue  # pragma: no cover
-
-                rule_name = rule["rule"]
-                rule_action = rule["action_if_failed"]
-                if rule_name in rules_failed_row_count.keys():
-                    failed_row_count = int(rules_failed_row_count[rule_name])
-                else:
-                    failed_row_count = 0
-
-                if failed_row_count is not None and failed_row_count > 0:
-                    error_drop_percentage = round(
-                        (failed_row_count / self._context.get_input_count) * 100, 2
-                    )
-                    error_threshold_list.append(
-                        {
-                            "rule_name": rule_name,
-                            "action_if_failed": rule_action,
-                            "description": rule["description"],
-                            "rule_type": rule["rule_type"],
-                            "error_drop_threshold": str(rule["error_drop_threshold"]),
-                            "error_drop_percentage": str(error_drop_percentage),
-                        }
-                    )
+            error_threshold_list = [
+                {
+                    "rule_name": rule["rule"],
+                    "action_if_failed": rule["action_if_failed"],
+                    "description": rule["description"],
+                    "rule_type": rule["rule_type"],
+                    "error_drop_threshold": str(rule["error_drop_threshold"]),
+                    "error_drop_percentage": str(
+                        round(
+                            (
+                                rules_failed_row_count[rule["rule"]]
+                                / self._context.get_input_count
+                            )
+                            * 100,
+                            2,
+                        )
+                    ),
+                }
+                for rule in rules[f"{self._context.get_row_dq_rule_type_name}_rules"]
+                if rules_failed_row_count.get(rule["rule"], 0) > 0
+            ]
 
             if len(error_threshold_list) > 0:
                 self._context.set_rules_exceeds_threshold(error_threshold_list)
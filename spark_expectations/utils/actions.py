@@ -1,4 +1,4 @@
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
 from pyspark.sql import DataFrame
 
 # from pyspark.sql.types import (
@@ -16,6 +16,7 @@ from pyspark.sql.functions import (
     struct,
     map_from_entries,
     array_contains,
+    sum as sql_sum,
 )
 from spark_expectations.utils.udf import remove_empty_maps, get_actions_list
 from spark_expectations.core.context import SparkExpectationsContext
@@ -235,7 +236,7 @@ class SparkExpectationsActions:
         _final_agg_dq_flag: bool = False,
         _source_query_dq_flag: bool = False,
         _final_query_dq_flag: bool = False,
-    ) -> DataFrame:
+    ) -> Tuple[DataFrame, int]:
         """
         This function takes necessary action set by the user on the rules and returns the dataframe with results
         Args:
@@ -257,7 +258,8 @@ class SparkExpectationsActions:
             _source_query_dq_result: source query based data quality result
             _final_query_dq_result: final query based data quality result
         Returns:
-                DataFrame: Returns a dataframe after dropping the error from the dataset
+                Tuple[DataFrame, int]: Returns a dataframe after dropping the error from the dataset, and the number
+                of records in it
 
         """
         try:
@@ -265,13 +267,17 @@ class SparkExpectationsActions:
                 "action_if_failed", get_actions_list(col(f"meta_{_rule_type}_results"))
             ).drop(f"meta_{_rule_type}_results")
 
-            if (
-                not _df_dq.filter(
-                    array_contains(_df_dq.action_if_failed, "fail")
-                ).count()
-                > 0
-            ):
-                _df_dq = _df_dq.filter(~array_contains(_df_dq.action_if_failed, "drop"))
+            # the check for failed rules and the output count are computed in a single pass
+            # the records are kept by the same predicate which counts them
+            _is_fail = array_contains(col("action_if_failed"), "fail")
+            _is_kept = ~array_contains(col("action_if_failed"), "drop")
+            _action_counts = _df_dq.select(
+                sql_sum(when(_is_fail, 1).otherwise(0)).alias("fail_count"),
+                sql_sum(when(_is_kept, 1).otherwise(0)).alias("output_count"),
+            ).first()
+
+            if not (_action_counts["fail_count"] or 0) > 0:
+                _df_dq = _df_dq.filter(_is_kept)
             else:
                 if _row_dq_flag:
                     _context.set_row_dq_status("Failed")
@@ -290,7 +296,10 @@ class SparkExpectationsActions:
                     "suggested to fail"
                 )
 
-            return _df_dq.drop(_df_dq.action_if_failed)
+            return (
+                _df_dq.drop(_df_dq.action_if_failed),
+                _action_counts["output_count"] or 0,
+            )
 
         except Exception as e:
             raise SparkExpectationsMiscException(
@@ -16,6 +16,23 @@ from spark_expectations.core.exceptions import (
 )
 
 
+_rule_columns: List[str] = [
+    "product_id",
+    "table_name",
+    "rule_type",
+    "rule",
+    "column_name",
+    "expectation",
+    "action_if_failed",
+    "enable_for_source_dq_validation",
+    "enable_for_target_dq_validation",
+    "tag",
+    "description",
+    "enable_error_drop_alert",
+    "error_drop_threshold",
+]
+
+
 @dataclass
 class SparkExpectationsReader:
     """
@@ -207,8 +224,8 @@ class SparkExpectationsReader:
 
             _rules_df: DataFrame = self.spark.sql(
                 f"""
-                        select * from {product_rules_table} where product_id='{self.product_id}' 
-                        and table_name='{target_table_name}'
+                        select {", ".join(_rule_columns)} from {product_rules_table}
+                        where product_id='{self.product_id}' and table_name='{target_table_name}'
                         and action_if_failed in ('{"', '".join(_actions_if_failed)}') and is_active=true
                         """
             )
@@ -216,30 +233,9 @@ class SparkExpectationsReader:
 
             _expectations: dict = {}
             for row in _rules_df.collect():
-                column_map = {
-                    "product_id": row["product_id"],
-                    "table_name": row["table_name"],
-                    "rule_type": row["rule_type"],
-                    "rule": row["rule"],
-                    "column_name": row["column_name"],
-                    "expectation": row["expectation"],
-                    "action_if_failed": row["action_if_failed"],
-                    "enable_for_source_dq_validation": row[
-                        "enable_for_source_dq_validation"
-                    ],
-                    "enable_for_target_dq_validation": row[
-                        "enable_for_target_dq_validation"
-                    ],
-                    "tag": row["tag"],
-                    "description": row["description"],
-                    "enable_error_drop_alert": row["enable_error_drop_alert"],
-                    "error_drop_threshold": row["error_drop_threshold"],
-                }
-
-                if f"{row['rule_type']}_rules" in _expectations:
-                    _expectations[f"{row['rule_type']}_rules"].append(column_map)
-                else:
-                    _expectations[f"{row['rule_type']}_rules"] = [column_map]
+                _expectations.setdefault(f"{row['rule_type']}_rules", []).append(
+                    row.asDict()
+                )
 
                 # count the rules enabled for the current run
                 if row["rule_type"] == self._context.get_row_dq_rule_type_name:
@@ -255,6 +251,7 @@ class SparkExpectationsReader:
                         row["enable_for_target_dq_validation"],
                     )
 
+            if _expectations:
                 _expectations["target_table_name"] = target_table_name
             return _expectations
         except Exception as e:
@@ -59,7 +59,7 @@ class SparkExpectationsRegulateFlow:
             final_query_dq_flag: bool = False,
             error_count: int = 0,
             output_count: int = 0,
-        ) -> Tuple[DataFrame, Optional[List[Dict[str, str]]], int, str]:
+        ) -> Tuple[DataFrame, Optional[List[Dict[str, str]]], int, int, str]:
             """
             This inner function helps to process data quality rules based on different rules types
             Args:
@@ -74,8 +74,8 @@ class SparkExpectationsRegulateFlow:
                 output_count: number of output records from expectations (default zero)
 
             Returns:
-                   Tuples with data frame which contains dq result, agg result in list, error count and
-                   status of the flow
+                   Tuples with data frame which contains dq result, agg result in list, error count, output count
+                   and status of the flow
 
             """
             try:
@@ -150,7 +150,7 @@ class SparkExpectationsRegulateFlow:
                 elif final_query_dq_flag:
                     _context.set_final_query_dq_result(agg_dq_res)
 
-                df = _actions.action_on_rules(
+                df, _output_count = _actions.action_on_rules(
                     _context,
                     _error_df if row_dq_flag else _df_dq,
                     table_name,
@@ -166,7 +166,7 @@ class SparkExpectationsRegulateFlow:
                 )
                 _context.print_dataframe_with_debugger(df)
 
-                return df, agg_dq_res, _error_count, "Passed"
+                return df, agg_dq_res, _error_count, _output_count, "Passed"
 
             except Exception as e:
                 raise SparkExpectationsMiscException(
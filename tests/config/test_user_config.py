@@ -42,7 +42,13 @@ def test_constants():
     assert user_config.se_notifications_on_error_drop_threshold == "spark.expectations.notifications." \
                                                                    "error.drop.threshold"
 
+    assert user_config.se_use_checkpoint_for_plan_break == "spark.expectations.use.checkpoint.for.plan.break"
+    assert user_config.se_skip_empty_dataframe == "spark.expectations.skip.empty.dataframe"
+    assert user_config.se_enable_concurrent_source_dq == "spark.expectations.concurrent.source.dq"
+
     assert user_config.se_enable_streaming == "se.enable.streaming"
+    assert user_config.se_buffer_stats_writes == "se.streaming.buffer.stats.writes"
+    assert user_config.se_buffer_stats_writes_size == "se.streaming.buffer.stats.writes.size"
 
     assert user_config.secret_type == "se.streaming.secret.type"
 
@@ -0,0 +1,90 @@
+import os
+import subprocess
+import time
+import pytest
+from spark_expectations.core import get_spark_session
+
+_docker_scripts_dir = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "../spark_expectations/examples/docker_scripts"
+)
+
+_kafka_docker_container_name = "spark_expectations_kafka_docker"
+
+# static settings for the small test datasets, which can't be changed once the session is created
+_spark_test_static_conf = {
+    "spark.default.parallelism": "1",
+    "spark.rdd.compress": "false",
+    "spark.shuffle.compress": "false",
+    "spark.ui.enabled": "false",
+    "spark.eventLog.enabled": "false",
+    "spark.driver.bindAddress": "127.0.0.1",
+}
+
+
+def pytest_configure(config):
+    config.addinivalue_line("markers", "kafka: tests which need the local kafka broker, deselect with -m 'not kafka'")
+
+    # the static settings are handed to spark-submit, which launches the jvm of the session, and the session is
+    # created here eagerly, before the test modules are collected and create their module-level sessions with
+    # get_spark_session
+    _submit_args = os.environ.get("PYSPARK_SUBMIT_ARGS", "pyspark-shell")
+    os.environ["PYSPARK_SUBMIT_ARGS"] = " ".join(
+        [f"--conf {key}={value}" for key, value in _spark_test_static_conf.items()] + [_submit_args]
+    )
+    get_spark_session()
+
+
+def pytest_collection_modifyitems(items):
+    # mark every test which uses the kafka broker, so that they can be deselected together
+    for item in items:
+        if "_fixture_local_kafka_topic" in getattr(item, "fixturenames", ()):
+            item.add_marker(pytest.mark.kafka)
+
+
+def _wait_for_kafka(topic: str = "dq-sparkexpectations-stats", retries: int = 30) -> None:
+    # the docker port mapping accepts connections before the broker is up, so the broker in the container is asked
+    # for its topics until the stats topic is listed
+    for _ in range(retries):
+        result = subprocess.run(
+            ["docker", "exec", _kafka_docker_container_name,
+             "kafka-topics.sh", "--bootstrap-server", "localhost:9092", "--list"],
+            capture_output=True, text=True, check=False
+        )
+        if result.returncode == 0 and topic in result.stdout.split():
+            return
+        time.sleep(1)
+    raise RuntimeError(f"kafka topic {topic} is not available in the docker container {_kafka_docker_container_name}")
+
+
+@pytest.fixture(name="spark", scope="session", autouse=True)
+def fixture_spark():
+    # one spark session for the whole test run, the static settings for the small test datasets are set in
+    # pytest_configure and the runtime sql settings are set once here instead of per test
+    spark = get_spark_session()
+    spark.conf.set("spark.sql.session.timeZone", "Etc/UTC")
+    spark.conf.set("spark.sql.shuffle.partitions", "1")
+    spark.conf.set("spark.sql.adaptive.enabled", "false")
+    spark.conf.set("spark.databricks.delta.stats.collect", "false")
+    spark.conf.set("spark.databricks.delta.snapshotPartitions", "2")
+
+    yield spark
+
+
+@pytest.fixture(name="_fixture_local_kafka_topic", scope="session")
+def fixture_setup_local_kafka_topic():
+    if os.getenv('UNIT_TESTING_ENV') != "spark_expectations_unit_testing_on_github_actions":
+        # remove if docker container is running
+        subprocess.run(["bash", f"{_docker_scripts_dir}/docker_kafka_stop_script.sh"], check=False)
+
+        # start docker container and create the topic, once for the whole test run
+        subprocess.run(["bash", f"{_docker_scripts_dir}/docker_kafka_start_script.sh"], check=True)
+        _wait_for_kafka()
+
+        yield "docker container started"
+
+        # remove docker container
+        subprocess.run(["bash", f"{_docker_scripts_dir}/docker_kafka_stop_script.sh"], check=False)
+
+    else:
+        yield "A Kafka server has been launched within a Docker container for the purpose of conducting tests " \
+              "in a Jenkins environment"
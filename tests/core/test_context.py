@@ -1354,3 +1354,32 @@ def test_get_rules_exceds_threshold():
         "error_drop_threshold": '10',
         "error_drop_percentage": '10.0',
     }]
+
+
+def test_reset_run_state():
+    context = SparkExpectationsContext(product_id="product1")
+    context.set_dq_run_status("Passed")
+    context.set_row_dq_status("Passed")
+    context.set_input_count(100)
+    context.set_error_count(10)
+    context.set_output_count(90)
+    context.set_source_agg_dq_result([{"rule": "rule1"}])
+    context.set_summarised_row_dq_res([{"rule": "rule1", "failed_row_count": "10"}])
+    context.set_row_dq_start_time()
+    context.set_row_dq_end_time()
+
+    context.reset_run_state()
+
+    assert context.get_dq_run_status == "Failed"
+    assert context.get_source_agg_dq_status == "Skipped"
+    assert context.get_source_query_dq_status == "Skipped"
+    assert context.get_row_dq_status == "Skipped"
+    assert context.get_final_agg_dq_status == "Skipped"
+    assert context.get_final_query_dq_status == "Skipped"
+    assert context.get_input_count == 0
+    assert context.get_error_count == 0
+    assert context.get_output_count == 0
+    assert context.get_source_agg_dq_result is None
+    assert context.get_summarised_row_dq_res is None
+    assert context._row_dq_start_time is None
+    assert context._row_dq_end_time is None
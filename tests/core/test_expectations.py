@@ -1,8 +1,9 @@
 # pylint: disable=too-many-lines
-import os
+import shutil
 from unittest.mock import Mock
 from unittest.mock import patch
 import pytest
+import pyspark
 from pyspark.sql import DataFrame
 from pyspark.sql.functions import lit, to_timestamp, col
 from pyspark.sql.types import StringType, IntegerType, StructField, StructType
@@ -21,28 +22,6 @@ from spark_expectations.sinks.utils.collect_statistics import SparkExpectationsC
 spark = get_spark_session()
 
 
-@pytest.fixture(name="_fixture_local_kafka_topic")
-def fixture_setup_local_kafka_topic():
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-
-    if os.getenv('UNIT_TESTING_ENV') != "spark_expectations_unit_testing_on_github_actions":
-
-        # remove if docker conatiner is running
-        os.system(f"sh {current_dir}/../../spark_expectations/examples/docker_scripts/docker_kafka_stop_script.sh")
-
-        # start docker container and create the topic
-        os.system(f"sh {current_dir}/../../spark_expectations/examples/docker_scripts/docker_kafka_start_script.sh")
-
-        yield "docker container started"
-
-        # remove docker container
-        os.system(f"sh {current_dir}/../../spark_expectations/examples/docker_scripts/docker_kafka_stop_script.sh")
-
-    else:
-        yield "A Kafka server has been launched within a Docker container for the purpose of conducting tests in " \
-              "a Jenkins environment"
-
-
 @pytest.fixture(name="_fixture_df")
 def fixture_df():
     # create a sample input raw dataframe for spark expectations
@@ -91,14 +70,14 @@ def fixture_expectations():
 @pytest.fixture(name="_fixture_create_database")
 def fixture_create_database():
     # drop and create dq_spark if exists
-    os.system("rm -rf /tmp/hive/warehouse/dq_spark.db")
+    shutil.rmtree("/tmp/hive/warehouse/dq_spark.db", ignore_errors=True)
     spark.sql("create database if not exists dq_spark")
     spark.sql("use dq_spark")
 
     yield "dq_spark"
 
     # drop dq_spark if exists
-    os.system("rm -rf /tmp/hive/warehouse/dq_spark.db")
+    shutil.rmtree("/tmp/hive/warehouse/dq_spark.db", ignore_errors=True)
 
 
 @pytest.fixture(name="_fixture_context")
@@ -140,12 +119,12 @@ def fixture_spark_expectations(_fixture_context):
 @pytest.fixture(name="_fixture_create_stats_table")
 def fixture_create_stats_table():
     # drop if exist dq_spark database and create with test_dq_stats_table
-    os.system("rm -rf /tmp/hive/warehouse/dq_spark.db")
+    shutil.rmtree("/tmp/hive/warehouse/dq_spark.db", ignore_errors=True)
     spark.sql("create database if not exists dq_spark")
     spark.sql("use dq_spark")
 
     spark.sql("drop table if exists test_dq_stats_table")
-    os.system("rm -rf /tmp/hive/warehouse/dq_spark.db/test_dq_stats_table")
+    shutil.rmtree("/tmp/hive/warehouse/dq_spark.db/test_dq_stats_table", ignore_errors=True)
 
     spark.sql(
         """
@@ -178,10 +157,23 @@ def fixture_create_stats_table():
     yield "test_dq_stats_table"
 
     spark.sql("drop table if exists test_dq_stats_table")
-    os.system("rm -rf /tmp/hive/warehouse/dq_spark.db/test_dq_stats_table")
+    shutil.rmtree("/tmp/hive/warehouse/dq_spark.db/test_dq_stats_table", ignore_errors=True)
 
     # remove database
-    os.system("rm -rf /tmp/hive/warehouse/dq_spark.db")
+    shutil.rmtree("/tmp/hive/warehouse/dq_spark.db", ignore_errors=True)
+
+
+def test_spark_expectations_lazy_helpers():
+    spark_expectations = SparkExpectations("product1")
+
+    # helpers are only created on first access
+    assert "_writer" not in spark_expectations.__dict__
+    assert "_statistics_decorator" not in spark_expectations.__dict__
+
+    assert spark_expectations._statistics_decorator._writer is spark_expectations._writer
+    assert spark_expectations._writer._context is spark_expectations._context
+    assert spark_expectations._notification._context is spark_expectations._context
+    assert spark_expectations.reader._context is spark_expectations._context
 
 
 @pytest.mark.parametrize("input_df, "
@@ -2300,7 +2292,7 @@ def test_with_expectations(input_df,
         "cast(value as string) as value").collect() == stats_table.selectExpr("to_json(struct(*)) AS value").collect()
 
     spark.sql("drop table if exists test_final_table_error")
-    os.system("rm -rf /tmp/hive/warehouse/dq_spark.db/test_final_table_error")
+    shutil.rmtree("/tmp/hive/warehouse/dq_spark.db/test_final_table_error", ignore_errors=True)
 
 
 # @pytest.mark.parametrize("write_to_table", [(True), (False)])
@@ -2370,6 +2362,368 @@ def test_with_expectations_patch(_write_error_stats,
     _write_error_stats.assert_called_once_with()
 
 
+@patch("spark_expectations.core.expectations.SparkExpectationsWriter.write_error_stats")
+def test_with_expectations_checkpoint_for_plan_break(_write_error_stats,
+                                                     _fixture_create_database,
+                                                     _fixture_spark_expectations,
+                                                     _fixture_context,
+                                                     _fixture_dq_rules,
+                                                     _fixture_df,
+                                                     _fixture_expectations):
+    _fixture_context._num_row_dq_rules = (_fixture_dq_rules.get("rules").get("num_row_dq_rules"))
+    _fixture_context._num_dq_rules = (_fixture_dq_rules.get("rules").get("num_dq_rules"))
+    _fixture_context._num_agg_dq_rules = (_fixture_dq_rules.get("agg_dq_rules"))
+    _fixture_context._num_query_dq_rules = (_fixture_dq_rules.get("query_dq_rules"))
+
+    with patch.object(_fixture_spark_expectations._writer, "write_df_to_table_v2") as _write_df_to_table_v2, \
+            patch.object(DataFrame, "localCheckpoint", autospec=True,
+                         side_effect=DataFrame.localCheckpoint) as _local_checkpoint:
+        decorated_func = _fixture_spark_expectations.with_expectations(
+            _fixture_expectations,
+            write_to_table=False,
+            write_to_temp_table=True,
+            agg_dq=None,
+            query_dq=None,
+            spark_conf={user_config.se_notifications_on_fail: False,
+                        user_config.se_use_checkpoint_for_plan_break: True},
+            options_error_table={'mode': 'overwrite', "format": "delta"}
+        )(Mock(return_value=_fixture_df))
+
+        decorated_func()
+
+        # the plan is broken with an eager local checkpoint of the input dataframe, so the temp table is never written
+        _local_checkpoint.assert_called_once_with(_fixture_df, eager=True)
+        _write_df_to_table_v2.assert_not_called()
+    _write_error_stats.assert_called_once_with()
+
+
+@patch("spark_expectations.core.expectations.SparkExpectationsWriter.write_error_stats")
+def test_with_expectations_temp_table_without_v2_format(_write_error_stats,
+                                                        _fixture_create_database,
+                                                        _fixture_spark_expectations,
+                                                        _fixture_df,
+                                                        _fixture_expectations):
+    # parquet tables can't be created or replaced with the v2 api, so the temp table is dropped and written again
+    with patch.object(_fixture_spark_expectations._writer, "write_df_to_table_v2") as _write_df_to_table_v2:
+        decorated_func = _fixture_spark_expectations.with_expectations(
+            _fixture_expectations,
+            write_to_table=False,
+            write_to_temp_table=True,
+            agg_dq=None,
+            query_dq=None,
+            spark_conf={user_config.se_notifications_on_fail: False},
+            options={'mode': 'overwrite', "format": "parquet"},
+            options_error_table={'mode': 'overwrite', "format": "delta"}
+        )(Mock(return_value=_fixture_df))
+
+        decorated_func()
+
+        _write_df_to_table_v2.assert_not_called()
+
+    assert spark.table("dq_spark.test_final_table_temp").count() == 3
+    _write_error_stats.assert_called_once_with()
+
+
+@patch("spark_expectations.core.expectations.SparkExpectationsWriter.write_error_stats")
+def test_with_expectations_reuse_source_agg_dq_results(_write_error_stats,
+                                                       _fixture_create_database,
+                                                       _fixture_spark_expectations,
+                                                       _fixture_context,
+                                                       _fixture_df):
+    expectations = {
+        "row_dq_rules": [{
+            "product_id": "product1",
+            "target_table_name": "dq_spark.test_table",
+            "rule_type": "row_dq",
+            "rule": "col1_threshold",
+            "column_name": "col1",
+            "expectation": "col1 > 0",
+            "action_if_failed": "drop",
+            "tag": "validity",
+            "description": "col1 value must be greater than 0",
+            "enable_error_drop_alert": True,
+            "error_drop_threshold": "10",
+        }],
+        "agg_dq_rules": [{
+            "product_id": "product1",
+            "target_table_name": "dq_spark.test_table",
+            "rule_type": "agg_dq",
+            "rule": "sum_col1_threshold",
+            "column_name": "col1",
+            "expectation": "sum(col1) > 20",
+            "enable_for_source_dq_validation": True,
+            "enable_for_target_dq_validation": True,
+            "action_if_failed": "ignore",
+            "tag": "strict",
+            "description": "sum col1 value must be greater than 20",
+            "enable_error_drop_alert": False,
+            "error_drop_threshold": "0",
+        }],
+        "target_table_name": "dq_spark.test_final_table"
+    }
+    _func_process_calls = []
+    _execute_dq_process = _fixture_spark_expectations._process.execute_dq_process
+
+    def _record_func_process(*args, **kwargs):
+        func_process = _execute_dq_process(*args, **kwargs)
+
+        def _func_process(*func_args, **func_kwargs):
+            _func_process_calls.append(func_kwargs)
+            return func_process(*func_args, **func_kwargs)
+
+        return _func_process
+
+    with patch.object(_fixture_spark_expectations._process, "execute_dq_process",
+                      side_effect=_record_func_process):
+        decorated_func = _fixture_spark_expectations.with_expectations(
+            expectations,
+            write_to_table=False,
+            agg_dq={user_config.se_agg_dq: True,
+                    user_config.se_source_agg_dq: True,
+                    user_config.se_final_agg_dq: True},
+            query_dq=None,
+            spark_conf={user_config.se_notifications_on_fail: False},
+        )(Mock(return_value=_fixture_df))
+
+        decorated_func()
+
+    # row dq does not drop any record, so the final agg dq is not evaluated again
+    assert not any(_kwargs.get("final_agg_dq_flag") for _kwargs in _func_process_calls)
+    assert _fixture_context.get_final_agg_dq_result == _fixture_context.get_source_agg_dq_result
+    assert _fixture_context.get_final_agg_dq_status == "Passed"
+
+
+@patch("spark_expectations.core.expectations.SparkExpectationsWriter.write_error_stats")
+def test_with_expectations_skip_empty_dataframe(_write_error_stats,
+                                                _fixture_create_database,
+                                                _fixture_spark_expectations,
+                                                _fixture_context,
+                                                _fixture_df,
+                                                _fixture_expectations):
+    _empty_df = _fixture_df.limit(0)
+
+    with patch.object(_fixture_spark_expectations._process, "execute_dq_process") as _execute_dq_process:
+        decorated_func = _fixture_spark_expectations.with_expectations(
+            _fixture_expectations,
+            write_to_table=True,
+            agg_dq=None,
+            query_dq=None,
+            spark_conf={user_config.se_notifications_on_fail: False,
+                        user_config.se_skip_empty_dataframe: True},
+            options_error_table={'mode': 'overwrite', "format": "delta"}
+        )(Mock(return_value=_empty_df))
+
+        result = decorated_func()
+
+        _execute_dq_process.assert_not_called()
+
+    assert result.count() == 0
+    # the empty result has the same columns as the row dq result of a non-empty dataframe
+    assert result.columns == _empty_df.columns + ["meta_dq_run_id", "meta_dq_run_date"]
+    assert spark.table("dq_spark.test_final_table").count() == 0
+    assert _fixture_context.get_input_count == 0
+    assert _fixture_context.get_row_dq_status == "Skipped"
+    assert _fixture_context.get_dq_run_status == "Passed"
+    _write_error_stats.assert_called_once_with()
+
+
+@patch("spark_expectations.core.expectations.SparkExpectationsWriter.write_error_stats")
+def test_with_expectations_skip_empty_dataframe_without_row_dq(_write_error_stats,
+                                                               _fixture_create_database,
+                                                               _fixture_spark_expectations,
+                                                               _fixture_df,
+                                                               _fixture_expectations):
+    decorated_func = _fixture_spark_expectations.with_expectations(
+        _fixture_expectations,
+        write_to_table=False,
+        row_dq=False,
+        agg_dq=None,
+        query_dq=None,
+        spark_conf={user_config.se_notifications_on_fail: False,
+                    user_config.se_skip_empty_dataframe: True},
+        options_error_table={'mode': 'overwrite', "format": "delta"}
+    )(Mock(return_value=_fixture_df.limit(0)))
+
+    # without row dq nothing is returned, the same as for a non-empty dataframe
+    assert decorated_func() is None
+    _write_error_stats.assert_called_once_with()
+
+
+@patch("spark_expectations.core.expectations.SparkExpectationsWriter.write_error_stats")
+def test_with_expectations_keeps_cached_input_dataframe(_write_error_stats,
+                                                       _fixture_create_database,
+                                                       _fixture_spark_expectations,
+                                                       _fixture_df,
+                                                       _fixture_expectations):
+    # the input dataframe is cached by the caller, so the run must not release it
+    _input_df = _fixture_df.cache()
+    _input_df.count()
+
+    decorated_func = _fixture_spark_expectations.with_expectations(
+        _fixture_expectations,
+        write_to_table=False,
+        agg_dq=None,
+        query_dq=None,
+        spark_conf={user_config.se_notifications_on_fail: False},
+        options_error_table={'mode': 'overwrite', "format": "delta"}
+    )(Mock(return_value=_input_df))
+
+    decorated_func()
+
+    assert _input_df.is_cached
+    assert _input_df.storageLevel.useMemory
+
+    _input_df.unpersist()
+
+
+@pytest.mark.parametrize("agg_dq, expected_persist_count", [
+    # the row dq dataframe is only written into the final table, so only the input dataframe is persisted
+    (None, 1),
+    # the final agg dq runs on the row dq dataframe as well, so it is persisted too
+    ({user_config.se_agg_dq: True,
+      user_config.se_source_agg_dq: False,
+      user_config.se_final_agg_dq: True}, 2),
+])
+@patch("spark_expectations.core.expectations.SparkExpectationsWriter.write_error_stats")
+def test_with_expectations_persists_row_dq_dataframe_for_final_dq(_write_error_stats,
+                                                                  agg_dq,
+                                                                  expected_persist_count,
+                                                                  _fixture_create_database,
+                                                                  _fixture_spark_expectations,
+                                                                  _fixture_df,
+                                                                  _fixture_expectations):
+    expectations = {
+        **_fixture_expectations,
+        "agg_dq_rules": [{
+            "product_id": "product1",
+            "target_table_name": "dq_spark.test_table",
+            "rule_type": "agg_dq",
+            "rule": "sum_col1_threshold",
+            "column_name": "col1",
+            "expectation": "sum(col1) > 20",
+            "enable_for_source_dq_validation": False,
+            "enable_for_target_dq_validation": True,
+            "action_if_failed": "ignore",
+            "tag": "strict",
+            "description": "sum col1 value must be greater than 20",
+            "enable_error_drop_alert": False,
+            "error_drop_threshold": "0",
+        }],
+    }
+
+    with patch.object(_fixture_spark_expectations, "_persist_for_run",
+                      wraps=_fixture_spark_expectations._persist_for_run) as _persist_for_run:
+        decorated_func = _fixture_spark_expectations.with_expectations(
+            expectations,
+            write_to_table=True,
+            agg_dq=agg_dq,
+            query_dq=None,
+            spark_conf={user_config.se_notifications_on_fail: False},
+            options={'mode': 'overwrite', "format": "delta"},
+            options_error_table={'mode': 'overwrite', "format": "delta"}
+        )(Mock(return_value=_fixture_df))
+
+        result = decorated_func()
+
+    assert _persist_for_run.call_count == expected_persist_count
+    assert _persist_for_run.call_args_list[0].args[0] is _fixture_df
+    # the dataframes persisted by the run are released once it is over
+    assert not _fixture_df.is_cached
+    assert not result.is_cached
+
+
+@pytest.mark.parametrize("inheritable_thread_target_available", [True, False])
+@patch("spark_expectations.core.expectations.SparkExpectationsWriter.write_error_stats")
+def test_with_expectations_concurrent_source_dq(_write_error_stats,
+                                                inheritable_thread_target_available,
+                                                monkeypatch,
+                                                _fixture_create_database,
+                                                _fixture_spark_expectations,
+                                                _fixture_context,
+                                                _fixture_df):
+    if not inheritable_thread_target_available:
+        # pyspark < 3.2, the source dq functions are submitted as they are
+        monkeypatch.delattr(pyspark, "inheritable_thread_target")
+    _fixture_df.createOrReplaceTempView("test_table")
+    expectations = {
+        "agg_dq_rules": [{
+            "product_id": "product1",
+            "target_table_name": "dq_spark.test_table",
+            "rule_type": "agg_dq",
+            "rule": "sum_col1_threshold",
+            "column_name": "col1",
+            "expectation": "sum(col1) > 20",
+            "enable_for_source_dq_validation": True,
+            "enable_for_target_dq_validation": True,
+            "action_if_failed": "ignore",
+            "tag": "strict",
+            "description": "sum col1 value must be greater than 20",
+            "enable_error_drop_alert": False,
+            "error_drop_threshold": "0",
+        }],
+        "query_dq_rules": [{
+            "product_id": "product1",
+            "target_table_name": "dq_spark.test_table",
+            "rule_type": "query_dq",
+            "rule": "max_col1_threshold",
+            "column_name": "col1",
+            "expectation": "(select max(col1) from test_table) > 10",
+            "enable_for_source_dq_validation": True,
+            "enable_for_target_dq_validation": True,
+            "action_if_failed": "ignore",
+            "tag": "validity",
+            "description": "max of col1 value must be greater than 10",
+            "enable_error_drop_alert": False,
+            "error_drop_threshold": "0",
+        }],
+        "row_dq_rules": [{}],
+        "target_table_name": "dq_spark.test_final_table"
+    }
+
+    # the local properties of the calling thread are recorded in the threads which run the source dq
+    _job_descriptions = []
+    _original_run_in_scheduler_pool = _fixture_spark_expectations._run_in_scheduler_pool
+
+    def _record_run_in_scheduler_pool(pool, func):
+        _job_descriptions.append(spark.sparkContext.getLocalProperty("spark.job.description"))
+        return _original_run_in_scheduler_pool(pool, func)
+
+    spark.sparkContext.setJobDescription("concurrent source dq")
+    with patch.object(_fixture_spark_expectations, "_run_in_scheduler_pool",
+                      side_effect=_record_run_in_scheduler_pool) as _run_in_scheduler_pool:
+        decorated_func = _fixture_spark_expectations.with_expectations(
+            expectations,
+            write_to_table=False,
+            row_dq=False,
+            agg_dq={user_config.se_agg_dq: True,
+                    user_config.se_source_agg_dq: True,
+                    user_config.se_final_agg_dq: False},
+            query_dq={user_config.se_query_dq: True,
+                      user_config.se_source_query_dq: True,
+                      user_config.se_final_query_dq: False,
+                      user_config.se_target_table_view: "test_table"},
+            spark_conf={user_config.se_notifications_on_fail: False,
+                        user_config.se_enable_concurrent_source_dq: True},
+        )(Mock(return_value=_fixture_df))
+
+        decorated_func()
+
+    spark.sparkContext.setJobDescription(None)
+
+    assert sorted(_call.args[0] for _call in _run_in_scheduler_pool.call_args_list) == ["dq_agg", "dq_query"]
+    if inheritable_thread_target_available:
+        assert _job_descriptions == ["concurrent source dq", "concurrent source dq"]
+    assert _fixture_context.get_source_agg_dq_status == "Passed"
+    assert _fixture_context.get_source_query_dq_status == "Passed"
+    assert _fixture_context.get_source_agg_dq_result == [{
+        "rule": "sum_col1_threshold", "rule_type": "agg_dq", "action_if_failed": "ignore", "tag": "strict",
+        "description": "sum col1 value must be greater than 20"}]
+    assert _fixture_context.get_source_query_dq_result == [{
+        "rule": "max_col1_threshold", "rule_type": "query_dq", "action_if_failed": "ignore", "tag": "validity",
+        "description": "max of col1 value must be greater than 10"}]
+    assert spark.sparkContext.getLocalProperty("spark.scheduler.pool") is None
+
+
 def test_with_expectations_dataframe_not_returned_exception(_fixture_create_database,
                                                             _fixture_spark_expectations,
                                                             _fixture_df,
@@ -2676,3 +3030,33 @@ def test_target_table_view_exception(input_df,
 
     with pytest.raises(SparkExpectationsMiscException, match=r"error occurred while processing spark expectations .*"):
         get_dataset()  # decorated_func()
+
+
+def test_flush_stats_buffer(_fixture_spark_expectations):
+    with patch.object(_fixture_spark_expectations._writer, "flush_stats_buffer") as _flush_stats_buffer:
+        _fixture_spark_expectations.flush_stats_buffer()
+
+    _flush_stats_buffer.assert_called_once_with()
+
+
+@patch("spark_expectations.core.expectations.SparkExpectationsWriter.write_error_stats")
+def test_with_expectations_non_numeric_error_drop_threshold(_write_error_stats,
+                                                            _fixture_create_database,
+                                                            _fixture_spark_expectations,
+                                                            _fixture_context,
+                                                            _fixture_df,
+                                                            _fixture_expectations):
+    # a threshold which is not an int falls back to the default of 100
+    decorated_func = _fixture_spark_expectations.with_expectations(
+        _fixture_expectations,
+        write_to_table=False,
+        agg_dq=None,
+        query_dq=None,
+        spark_conf={user_config.se_notifications_on_fail: False,
+                    user_config.se_notifications_on_error_drop_threshold: "ten"},
+        options_error_table={'mode': 'overwrite', "format": "delta"}
+    )(Mock(return_value=_fixture_df))
+
+    decorated_func()
+
+    assert _fixture_context.get_error_drop_threshold == 100
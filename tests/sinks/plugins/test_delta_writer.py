@@ -1,4 +1,4 @@
-import os
+import shutil
 import pytest
 from pyspark.sql.types import StructType, StructField, IntegerType, StringType
 from spark_expectations.core import get_spark_session
@@ -11,14 +11,14 @@ spark = get_spark_session()
 @pytest.fixture(name="_fixture_create_database")
 def fixture_create_database():
     # drop and create dq_spark if exists
-    os.system("rm -rf /tmp/hive/warehouse/dq_spark.db")
+    shutil.rmtree("/tmp/hive/warehouse/dq_spark.db", ignore_errors=True)
     spark.sql("create database if not exists dq_spark")
     spark.sql("use dq_spark")
 
     yield "dq_spark"
 
     # drop dq_spark if exists
-    os.system("rm -rf /tmp/hive/warehouse/dq_spark.db")
+    shutil.rmtree("/tmp/hive/warehouse/dq_spark.db", ignore_errors=True)
 
 
 @pytest.fixture(name="_fixture_dataset")
@@ -36,12 +36,12 @@ def fixture_dataset():
 @pytest.fixture(name="_fixture_create_test_table")
 def fixture_create_test_table():
     # drop if exist dq_spark database and create with test_dq_stats_table
-    os.system("rm -rf /tmp/hive/warehouse/dq_spark.db")
+    shutil.rmtree("/tmp/hive/warehouse/dq_spark.db", ignore_errors=True)
     spark.sql("create database if not exists dq_spark")
     spark.sql("use dq_spark")
 
     spark.sql("drop table if exists test_table")
-    os.system("rm -rf /tmp/hive/warehouse/dq_spark.db/test_table")
+    shutil.rmtree("/tmp/hive/warehouse/dq_spark.db/test_table", ignore_errors=True)
     spark.sql(
         """
         create table test_table_write (
@@ -56,10 +56,10 @@ def fixture_create_test_table():
     yield "test_table"
 
     spark.sql("drop table if exists test_table_write")
-    os.system("rm -rf /tmp/hive/warehouse/dq_spark.db/test_table_write")
+    shutil.rmtree("/tmp/hive/warehouse/dq_spark.db/test_table_write", ignore_errors=True)
 
     # remove database
-    os.system("rm -rf /tmp/hive/warehouse/dq_spark.db")
+    shutil.rmtree("/tmp/hive/warehouse/dq_spark.db", ignore_errors=True)
 
 
 # Write the test function
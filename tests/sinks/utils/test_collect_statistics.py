@@ -1,4 +1,4 @@
-import os
+import shutil
 from unittest.mock import patch
 import pytest
 from pyspark.sql.functions import col
@@ -10,36 +10,15 @@ from spark_expectations.core.exceptions import SparkExpectationsMiscException
 spark = get_spark_session()
 
 
-@pytest.fixture(name="_fixture_local_kafka_topic")
-def fixture_setup_local_nsp_topic():
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-
-    if os.getenv('UNIT_TESTING_ENV') != "spark_expectations_unit_testing_on_github_actions":
-        # remove if docker conatiner is running
-        os.system(f"sh {current_dir}/../../../spark_expectations/examples/docker_scripts/docker_kafka_stop_script.sh")
-
-        # start docker container and create the topic
-        os.system(f"sh {current_dir}/../../../spark_expectations/examples/docker_scripts/docker_kafka_start_script.sh")
-
-        yield "docker container started"
-
-        # remove docker container
-        os.system(f"sh {current_dir}/../../../spark_expectations/examples/docker_scripts/docker_kafka_stop_script.sh")
-
-    else:
-        yield "A Kafka server has been launched within a Docker container for the purpose of conducting tests in" \
-              " a Jenkins environment"
-
-
 @pytest.fixture(name="_fixture_create_stats_table")
 def fixture_create_stats_table():
     # drop if exist dq_spark database and create with test_dq_stats_table
-    os.system("rm -rf /tmp/hive/warehouse/dq_spark.db")
+    shutil.rmtree("/tmp/hive/warehouse/dq_spark.db", ignore_errors=True)
     spark.sql("create database if not exists dq_spark")
     spark.sql("use dq_spark")
 
     spark.sql("drop table if exists test_dq_stats_table")
-    os.system("rm -rf /tmp/hive/warehouse/dq_spark.db/test_dq_stats_table")
+    shutil.rmtree("/tmp/hive/warehouse/dq_spark.db/test_dq_stats_table", ignore_errors=True)
     spark.sql(
         """
     create table test_dq_stats_table (
@@ -71,10 +50,10 @@ def fixture_create_stats_table():
     yield "test_dq_stats_table"
 
     spark.sql("drop table if exists test_dq_stats_table")
-    os.system("rm -rf /tmp/hive/warehouse/dq_spark.db/test_dq_stats_table")
+    shutil.rmtree("/tmp/hive/warehouse/dq_spark.db/test_dq_stats_table", ignore_errors=True)
 
     # remove database
-    os.system("rm -rf /tmp/hive/warehouse/dq_spark.db")
+    shutil.rmtree("/tmp/hive/warehouse/dq_spark.db", ignore_errors=True)
 
 
 @pytest.mark.parametrize("input_record, expected_result", [
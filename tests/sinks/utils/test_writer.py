@@ -1,9 +1,12 @@
+import json
 import os
-from unittest.mock import patch
+from unittest.mock import patch, MagicMock
 import pytest
+from pyspark import StorageLevel
+from pyspark.sql import DataFrame
 from pyspark.sql.functions import col
-from pyspark.sql.functions import lit, to_timestamp
-from spark_expectations.core import get_spark_session
+from pyspark.sql.types import StructType, StructField, StringType, IntegerType, LongType, ArrayType, MapType
+from spark_expectations.config.user_config import Constants as user_config
 from spark_expectations.core.context import SparkExpectationsContext
 from spark_expectations.sinks.utils.writer import SparkExpectationsWriter
 from spark_expectations.core.exceptions import (
@@ -11,41 +14,69 @@ from spark_expectations.core.exceptions import (
     SparkExpectationsUserInputOrConfigInvalidException
 )
 
-spark = get_spark_session()
 
+_employee_schema = StructType([
+    StructField("eeid", StringType()),
+    StructField("full_name", StringType()),
+    StructField("job_title", StringType()),
+    StructField("department", StringType()),
+    StructField("business_unit", StringType()),
+    StructField("gender", StringType()),
+    StructField("ethnicity", StringType()),
+    StructField("age", IntegerType()),
+    StructField("hire_date", StringType()),
+    StructField("annual_salary", StringType()),
+    StructField("bonus", IntegerType()),
+    StructField("country", StringType()),
+    StructField("city", StringType()),
+    StructField("exit_date", StringType()),
+])
 
-@pytest.fixture(name="_fixture_local_kafka_topic")
-def fixture_setup_local_nsp_topic():
-    current_dir = os.path.dirname(os.path.abspath(__file__))
-
-    if os.getenv('UNIT_TESTING_ENV') != "spark_expectations_unit_testing_on_github_actions":
-        # remove if docker conatiner is running
-        os.system(f"sh {current_dir}/../../../spark_expectations/examples/docker_scripts/docker_kafka_stop_script.sh")
 
-        # start docker container and create the topic
-        os.system(f"sh {current_dir}/../../../spark_expectations/examples/docker_scripts/docker_kafka_start_script.sh")
+# explicit schemas for the test dataframes, so that createDataFrame does not infer them from the rows
+_dq_dataset_schema = StructType([
+    StructField("id", LongType()),
+    StructField("name", StringType()),
+    StructField("row_dq_id", MapType(StringType(), StringType())),
+    StructField("row_dq_name", MapType(StringType(), StringType())),
+])
 
-        yield "docker container started"
+_row_dq_results_type = ArrayType(MapType(StringType(), StringType()))
 
-        # remove docker container
-        os.system(f"sh {current_dir}/../../../spark_expectations/examples/docker_scripts/docker_kafka_stop_script.sh")
+_summarised_row_dq_schema = StructType([StructField("meta_row_dq_results", _row_dq_results_type)])
 
-    else:
-        yield "A Kafka server has been launched within a Docker container for the purpose of conducting tests " \
-              "in a Jenkins environment"
+_stats_schema = "product_id string, input_count long"
 
 
-@pytest.fixture(name="_fixture_employee")
-def fixture_employee_df():
+@pytest.fixture(name="_fixture_employee_rows", scope="session")
+def fixture_employee_rows(spark):
+    # read the csv once with an explicit schema, the rows are kept on the driver for the whole session
     return (spark.read.option("header", "true")
-            .option("inferSchema", "true")
+            .schema(_employee_schema)
             .csv(os.path.join(os.path.dirname(__file__), "../../resources/employee.csv"))
-            )
+            .collect())
+
+
+@pytest.fixture(name="_fixture_employee", scope="session")
+def fixture_employee_df(spark, _fixture_employee_rows):
+    # the employee dataframe is only read by the tests, so it is materialized once for the session
+    df = spark.createDataFrame(_fixture_employee_rows, _employee_schema).persist(StorageLevel.MEMORY_ONLY)
+    df.count()
+
+    yield df
 
+    df.unpersist()
 
-@pytest.fixture(name="_fixture_writer")
+
+@pytest.fixture(name="_fixture_single_row_df", scope="session")
+def fixture_single_row_df(spark):
+    # the exception tests fail on the write options, so any dataframe will do for them
+    return spark.range(1)
+
+
+@pytest.fixture(name="_fixture_writer", scope="session")
 @patch('spark_expectations.sinks.utils.writer.SparkExpectationsContext', autospec=True, spec_set=True)
-def fixture_writer(mock_context):
+def fixture_writer(mock_context, spark):
     # create mock _context object
     setattr(mock_context, "get_dq_stats_table_name", "test_dq_stats_table")
     setattr(mock_context, "get_run_date", "2022-12-27 10:39:44")
@@ -57,32 +88,46 @@ def fixture_writer(mock_context):
     return SparkExpectationsWriter("product1", mock_context)
 
 
-@pytest.fixture(name="_fixture_create_employee_table")
-def fixture_create_employee_table():
-    # drop if exist dq_spark database and create with employee_table
-    os.system("rm -rf /tmp/hive/warehouse/dq_spark.db")
+@pytest.fixture(autouse=True)
+def fixture_reset_writer(_fixture_writer):
+    # the writer is shared by the whole session, only the stats buffer changes between the tests
+    yield
+    _fixture_writer._stats_buffer = []
+
+
+@pytest.fixture(name="_fixture_employee_table", scope="module")
+def fixture_employee_table(spark):
+    # create employee_table once for the module
     spark.sql("create database if not exists dq_spark")
     spark.sql("use dq_spark")
-    spark.sql("create table employee_table USING delta")
+    spark.sql("drop table if exists dq_spark.employee_table")
+    spark.sql("create table dq_spark.employee_table USING delta")
 
     yield "employee_table"
 
-    spark.sql("drop table if exists employee_table")
-    os.system("rm -rf /tmp/hive/warehouse/dq_spark.db/employee_table")
+    spark.sql("drop table if exists dq_spark.employee_table")
 
 
-@pytest.fixture(name="_fixture_create_stats_table")
-def fixture_create_stats_table():
-    # drop if exist dq_spark database and create with test_dq_stats_table
-    os.system("rm -rf /tmp/hive/warehouse/dq_spark.db")
+@pytest.fixture(name="_fixture_create_employee_table")
+def fixture_create_employee_table(spark, _fixture_employee_table):
+    spark.sql("use dq_spark")
+
+    yield _fixture_employee_table
+
+    # empty the table for the next test, instead of dropping and re-creating the database
+    spark.sql(f"delete from dq_spark.{_fixture_employee_table}")
+
+
+@pytest.fixture(name="_fixture_stats_table", scope="module")
+def fixture_stats_table(spark):
+    # create test_dq_stats_table once for the module
     spark.sql("create database if not exists dq_spark")
     spark.sql("use dq_spark")
 
-    spark.sql("drop table if exists test_dq_stats_table")
-    os.system("rm -rf /tmp/hive/warehouse/dq_spark.db/test_dq_stats_table")
+    spark.sql("drop table if exists dq_spark.test_dq_stats_table")
     spark.sql(
         """
-    create table test_dq_stats_table (
+    create table dq_spark.test_dq_stats_table (
     product_id STRING,
     table_name STRING,
     input_count LONG,
@@ -110,43 +155,55 @@ def fixture_create_stats_table():
 
     yield "test_dq_stats_table"
 
-    spark.sql("drop table if exists test_dq_stats_table")
-    os.system("rm -rf /tmp/hive/warehouse/dq_spark.db/test_dq_stats_table")
+    spark.sql("drop table if exists dq_spark.test_dq_stats_table")
+
+
+@pytest.fixture(name="_fixture_create_stats_table")
+def fixture_create_stats_table(spark, _fixture_stats_table):
+    spark.sql("use dq_spark")
+
+    yield _fixture_stats_table
+
+    # empty the table for the next test, instead of dropping and re-creating it
+    spark.sql(f"delete from dq_spark.{_fixture_stats_table}")
 
-    # remove database
-    os.system("rm -rf /tmp/hive/warehouse/dq_spark.db")
 
+@pytest.fixture(name="_fixture_write_stats_cases", scope="session")
+def fixture_write_stats_cases():
+    # input records and expected results of the write_error_stats cases
+    with open(os.path.join(os.path.dirname(__file__), "../../resources/write_stats_cases.json")) as cases_file:
+        return [(case["input_record"], case["expected_result"]) for case in json.load(cases_file)]
 
-@pytest.fixture(name="_fixture_dq_dataset")
-def fixture_dq_dataset():
-    return spark.createDataFrame([(1, "a", {"id": "1", "rule": "rule1"}, {}),
-                                  (2, "b", {}, {}),
-                                  (3, "c", {"id": "3", "rule": "rule1"}, {"name": "c", "rule": "rule2"}),
-                                  (4, "d", {}, {"name": "d", "rule": "rule2"})],
-                                 ['id', "name", "row_dq_id", "row_dq_name"])
 
+@pytest.fixture(name="_fixture_dq_dataset", scope="session")
+def fixture_dq_dataset(spark):
+    df = spark.createDataFrame([(1, "a", {"id": "1", "rule": "rule1"}, {}),
+                                (2, "b", {}, {}),
+                                (3, "c", {"id": "3", "rule": "rule1"}, {"name": "c", "rule": "rule2"}),
+                                (4, "d", {}, {"name": "d", "rule": "rule2"})],
+                               _dq_dataset_schema).persist(StorageLevel.MEMORY_ONLY)
+    df.count()
 
-@pytest.fixture(name="_fixture_expected_error_dataset")
-def fixture_expected_error_dataset():
-    spark.conf.set("spark.sql.session.timeZone", "Etc/UTC")
-    return spark.createDataFrame([(1, "a", [{"id": "1", "rule": "rule1"}], "product1_run_test"),
-                                  (3, "c", [{"id": "3", "rule": "rule1"}, {"name": "c", "rule": "rule2"}],
-                                   "product1_run_test"),
-                                  (4, "d", [{"name": "d", "rule": "rule2"}], "product1_run_test")],
-                                 ['id', "name", "meta_row_dq_results", "run_id"]) \
-        .withColumn("meta_dq_run_date", to_timestamp(lit("2022-12-27 10:39:44")))
+    yield df
 
+    df.unpersist()
 
-@pytest.fixture(name="_fixture_expected_dq_dataset")
-def fixture_expected_dq_dataset():
-    spark.conf.set("spark.sql.session.timeZone", "Etc/UTC")
-    return spark.createDataFrame([(1, "a", [{"id": "1", "rule": "rule1"}], "product1_run_test"),
-                                  (2, "b", [], "product1_run_test"),
-                                  (3, "c", [{"id": "3", "rule": "rule1"}, {"name": "c", "rule": "rule2"}],
-                                   "product1_run_test"),
-                                  (4, "d", [{"name": "d", "rule": "rule2"}], "product1_run_test")],
-                                 ['id', "name", "meta_row_dq_results", "meta_dq_run_id"]) \
-        .withColumn("meta_dq_run_date", to_timestamp(lit("2022-12-27 10:39:44")))
+
+# expected rows ordered by id, with the columns id, name, meta_row_dq_results, meta_dq_run_id and meta_dq_run_date
+_expected_error_rows = [
+    (1, "a", [{"id": "1", "rule": "rule1"}], "product1_run_test", "2022-12-27 10:39:44"),
+    (3, "c", [{"id": "3", "rule": "rule1"}, {"name": "c", "rule": "rule2"}], "product1_run_test",
+     "2022-12-27 10:39:44"),
+    (4, "d", [{"name": "d", "rule": "rule2"}], "product1_run_test", "2022-12-27 10:39:44"),
+]
+
+_expected_dq_rows = [
+    (1, "a", [{"id": "1", "rule": "rule1"}], "product1_run_test", "2022-12-27 10:39:44"),
+    (2, "b", [], "product1_run_test", "2022-12-27 10:39:44"),
+    (3, "c", [{"id": "3", "rule": "rule1"}, {"name": "c", "rule": "rule2"}], "product1_run_test",
+     "2022-12-27 10:39:44"),
+    (4, "d", [{"name": "d", "rule": "rule2"}], "product1_run_test", "2022-12-27 10:39:44"),
+]
 
 
 @pytest.mark.parametrize('table_name, spark_conf, options, expected_count',
@@ -156,7 +213,8 @@ def fixture_expected_dq_dataset():
                           ('employee_table', {"spark.sql.session.timeZone": "Etc/UTC"},
                            {'mode': 'append', "format": "delta", "mergeSchema": "true"}, 1000)
                           ])
-def test_save_df_as_table(table_name,
+def test_save_df_as_table(spark,
+                          table_name,
                           spark_conf,
                           options,
                           expected_count,
@@ -171,6 +229,47 @@ def test_save_df_as_table(table_name,
     # _spark_set.assert_called_with('spark.sql.session.timeZone', 'Etc/UTC')
 
 
+@pytest.mark.parametrize('table_name, options, expected_count',
+                         [('employee_table', {'mode': 'overwrite', 'partitionBy': ['department'],
+                                              "format": "delta"}, 1000),
+                          ('employee_table', None, 1000)
+                          ])
+def test_write_df_to_table_v2(spark,
+                              table_name,
+                              options,
+                              expected_count,
+                              _fixture_employee,
+                              _fixture_writer,
+                              _fixture_create_employee_table):
+    # the table is replaced on every write, so writing twice keeps a single copy of the data
+    _fixture_writer.write_df_to_table_v2(_fixture_employee, table_name, options=options)
+    _fixture_writer.write_df_to_table_v2(_fixture_employee, table_name, options=options)
+
+    assert expected_count == spark.table(table_name).count()
+    assert spark.sql(f"SHOW TBLPROPERTIES {table_name} ('product_id')").first()["value"] == "product1"
+
+
+def test_write_df_to_table_v2_exception(_fixture_single_row_df, _fixture_writer):
+    with pytest.raises(SparkExpectationsMiscException,
+                       match=r"error occurred while saving the data into the table .*"):
+        _fixture_writer.write_df_to_table_v2(_fixture_single_row_df, "employee_table", options={"format": "test"})
+
+
+@pytest.mark.parametrize('options, expected_result',
+                         [({"format": "delta"}, True),
+                          (None, True),
+                          ({"mode": "overwrite", "format": "parquet"}, False)
+                          ])
+def test_supports_write_df_to_table_v2(options, expected_result, _fixture_writer):
+    assert _fixture_writer.supports_write_df_to_table_v2(options) is expected_result
+
+
+def test_supports_write_df_to_table_v2_without_writer_v2(monkeypatch, _fixture_writer):
+    # pyspark < 3.1 has no DataFrameWriterV2
+    monkeypatch.delattr(DataFrame, "writeTo")
+    assert _fixture_writer.supports_write_df_to_table_v2({"format": "delta"}) is False
+
+
 @pytest.mark.parametrize('table_name, options',
                          [('employee_table', {'mode': 'overwrite',
                                               'partitionBy': ['department'],
@@ -194,399 +293,223 @@ def test_write_df_to_table(save_df_as_table,
     )
 
 
-@pytest.mark.parametrize("input_record, expected_result", [
-    ({
-         "input_count": 100,
-         "error_count": 10,
-         "output_count": 90,
-         "source_agg_results": [
-             {"rule_name": "rule1", "action_if_failed": "ignore", "description": "not null values in col1",
-              "rule_type": "agg_dq"}],
-         "final_agg_results": [
-             {"rule_name": "rule1", "action_if_failed": "ignore", "description": "not null values in col1",
-              "rule_type": "agg_dq"}],
-         "source_query_dq_results": [
-             {"rule_name": "rule5", "action_if_failed": "ignore", "description": "sum of col5 must be gt 100",
-              "rule_type": "query_dq"}],
-         "final_query_dq_results": [
-             {"rule_name": "rule6", "action_if_failed": "ignore", "description": "distinct in col6 must be lt 3",
-              "rule_type": "query_dq"}],
-         "row_dq_res_summary": [
-             {"rule_name": "rule1", "action_if_failed": "ignore", "rule_type": "row_dq", "failed_count": 10},
-             {"rule_name": "rule2", "action_if_failed": "drop", "rule_type": "row_dq", "failed_count": 5},
-             {"rule_name": "rule3", "action_if_failed": "ignore", "rule_type": "row_dq", "failed_count": 3}],
-         "row_dq_error_threshold": [
-             {"rule_name": "rule1", "action_if_failed": "ignore", "description": "description1",
-              "rule_type": "row_dq", "error_drop_threshold": "15", "error_drop_percentage": "10.0"},
-             {"rule_name": "rule2", "action_if_failed": "drop", "description": "description2",
-              "rule_type": "row_dq", "error_drop_threshold": "10", "error_drop_percentage": "0.5"},
-             {"rule_name": "rule3", "action_if_failed": "ignore", "description": "description3",
-              "rule_type": "row_dq", "error_drop_threshold": "5", "error_drop_percentage": "0.3"}
-         ],
-
-         "dq_run_time": {"final_query_dq_run_time": 22.7, "source_agg_dq_run_time": 17.2, "row_dq_run_time": 29.3,
-                         "source_query_dq_run_time": 22.4, "final_agg_dq_run_time": 11.0, "run_time": 108.5},
-         "dq_rules": {"rules": {"num_dq_rules": 17, "num_row_dq_rules": 5},
-                      "query_dq_rules": {"num_final_query_dq_rules": 8, "num_source_query_dq_rules": 3,
-                                         "num_query_dq_rules": 5},
-                      "agg_dq_rules": {"num_source_agg_dq_rules": 4, "num_agg_dq_rules": 4,
-                                       "num_final_agg_dq_rules": 1}},
-         "status": {"run_status": "Passed", "source_agg_dq": "Passed", "row_dq": "Passed", "final_agg_dq": "Passed",
-                    "source_query_dq": "Passed", "final_query_dq": "Passed"},
-     }, {
-         "output_percentage": 90.0,
-         "success_percentage": 90.0,
-         "error_percentage": 10.0
-     }),
-    ({
-         "input_count": 100,
-         "error_count": 10,
-         "output_count": 95,
-         "source_agg_results": None,
-         "final_agg_results": [
-             {"rule_name": "rule2", "action_if_failed": "drop", "description": "not null values in col2",
-              "rule_type": "agg_dq"}],
-         "source_query_dq_results": None,
-         "final_query_dq_results": None,
-         "row_dq_res_summary": [
-             {"rule_name": "rule1", "action_if_failed": "ignore", "rule_type": "row_dq", "failed_count": 10},
-             {"rule_name": "rule2", "action_if_failed": "drop", "rule_type": "row_dq", "failed_count": 7},
-             {"rule_name": "rule3", "action_if_failed": "ignore", "rule_type": "row_dq", "failed_count": 8}],
-         "row_dq_error_threshold": [
-             {"rule_name": "rule1", "action_if_failed": "ignore", "description": "description1",
-              "rule_type": "row_dq", "error_drop_threshold": "15", "error_drop_percentage": "1.0"},
-             {"rule_name": "rule2", "action_if_failed": "drop", "description": "description2",
-              "rule_type": "row_dq", "error_drop_threshold": "10", "error_drop_percentage": "0.7"},
-             {"rule_name": "rule3", "action_if_failed": "ignore", "description": "description3",
-              "rule_type": "row_dq", "error_drop_threshold": "5", "error_drop_percentage": "0.8"}
-         ],
-         "dq_run_time": {"final_query_dq_run_time": 0.0, "source_agg_dq_run_time": 0.0, "row_dq_run_time": 29.3,
-                         "source_query_dq_run_time": 0.0, "final_agg_dq_run_time": 11.0, "run_time": 108.5},
-         "dq_rules": {"rules": {"num_dq_rules": 14, "num_row_dq_rules": 3},
-                      "query_dq_rules": {"num_final_query_dq_rules": 5, "num_source_query_dq_rules": 5,
-                                         "num_query_dq_rules": 1},
-                      "agg_dq_rules": {"num_source_agg_dq_rules": 4, "num_agg_dq_rules": 2,
-                                       "num_final_agg_dq_rules": 4}},
-         "status": {"run_status": "Passed", "source_agg_dq": "Skipped", "row_dq": "Passed", "final_agg_dq": "Passed",
-                    "source_query_dq": "Skipped", "final_query_dq": "Skipped"}
-     }, {
-         "output_percentage": 95.0,
-         "success_percentage": 90.0,
-         "error_percentage": 10.0,
-     }),
-    ({
-         "input_count": 100,
-         "error_count": 100,
-         "output_count": 100,
-         "source_agg_results": [
-             {"rule_name": "rule2", "action_if_failed": "drop", "description": "not null values in col2",
-              "rule_type": "agg_dq"}],
-         "final_agg_results": None,
-         "source_query_dq_results": None,
-         "final_query_dq_results": [
-             {"rule_name": "rule5", "action_if_failed": "ignore", "description": "sum of col5 must be gt 100",
-              "rule_type": "query_dq"}],
-         "row_dq_res_summary": [
-             {"rule_name": "rule1", "action_if_failed": "ignore", "rule_type": "row_dq", "failed_count": 10},
-             {"rule_name": "rule2", "action_if_failed": "drop", "rule_type": "row_dq", "failed_count": 7},
-             {"rule_name": "rule3", "action_if_failed": "ignore", "rule_type": "row_dq", "failed_count": 8}],
-         "row_dq_error_threshold": [
-             {"rule_name": "rule1", "action_if_failed": "ignore", "description": "description1",
-              "rule_type": "row_dq", "error_drop_threshold": "15", "error_drop_percentage": "1.0"},
-             {"rule_name": "rule2", "action_if_failed": "drop", "description": "description2",
-              "rule_type": "row_dq", "error_drop_threshold": "10", "error_drop_percentage": "0.7"},
-             {"rule_name": "rule3", "action_if_failed": "ignore", "description": "description3",
-              "rule_type": "row_dq", "error_drop_threshold": "5", "error_drop_percentage": "0.8"}
-         ],
-         "dq_run_time": {"final_query_dq_run_time": 22.7, "source_agg_dq_run_time": 17.2, "row_dq_run_time": 29.3,
-                         "source_query_dq_run_time": 0.0, "final_agg_dq_run_time": 0.0, "run_time": 108.5},
-         "dq_rules": {"rules": {"num_dq_rules": 17, "num_row_dq_rules": 10},
-                      "query_dq_rules": {"num_final_query_dq_rules": 5, "num_source_query_dq_rules": 2,
-                                         "num_query_dq_rules": 3},
-                      "agg_dq_rules": {"num_source_agg_dq_rules": 4, "num_agg_dq_rules": 2,
-                                       "num_final_agg_dq_rules": 2}},
-         "status": {"run_status": "Passed", "source_agg_dq": "Passed", "row_dq": "Passed", "final_agg_dq": "Skipped"
-             , "source_query_dq": "Skipped", "final_query_dq": "Passed"}
-     }, {
-         "output_percentage": 100.0,
-         "success_percentage": 0.0,
-         "error_percentage": 100.0,
-     }),
-    ({
-         "input_count": 100,
-         "error_count": 100,
-         "output_count": 0,
-         "source_agg_results": [
-             {"rule_name": "rule2", "action_if_failed": "drop", "description": "not null values in col2",
-              "rule_type": "agg_dq"}],
-         "final_agg_results": None,
-         "source_query_dq_results": None,
-         "final_query_dq_results": None,
-         "row_dq_res_summary": [
-             {"rule_name": "rule1", "action_if_failed": "fail", "rule_type": "row_dq", "failed_count": 10},
-             {"rule_name": "rule2", "action_if_failed": "drop", "rule_type": "row_dq", "failed_count": 7},
-             {"rule_name": "rule3", "action_if_failed": "ignore", "rule_type": "row_dq", "failed_count": 8}],
-         "row_dq_error_threshold": [
-             {"rule_name": "rule1", "action_if_failed": "ignore", "description": "description1",
-              "rule_type": "row_dq", "error_drop_threshold": "15", "error_drop_percentage": "1.0"},
-             {"rule_name": "rule2", "action_if_failed": "drop", "description": "description2",
-              "rule_type": "row_dq", "error_drop_threshold": "10", "error_drop_percentage": "0.7"},
-             {"rule_name": "rule3", "action_if_failed": "ignore", "description": "description3",
-              "rule_type": "row_dq", "error_drop_threshold": "5", "error_drop_percentage": "0.8"}
-         ],
-         "dq_run_time": {"final_query_dq_run_time": 0.7, "source_agg_dq_run_time": 17.2, "row_dq_run_time": 29.3,
-                         "source_query_dq_run_time": 0.0, "final_agg_dq_run_time": 0.0, "run_time": 118.5},
-         "dq_rules": {"rules": {"num_dq_rules": 18, "num_row_dq_rules": 5},
-                      "query_dq_rules": {"num_final_query_dq_rules": 5, "num_source_query_dq_rules": 5,
-                                         "num_query_dq_rules": 5},
-                      "agg_dq_rules": {"num_source_agg_dq_rules": 8, "num_agg_dq_rules": 4,
-                                       "num_final_agg_dq_rules": 8}},
-         "status": {"run_status": "Failed", "source_agg_dq": "Passed", "row_dq": "Passed", "final_agg_dq": "Skipped"
-             , "source_query_dq": "Skipped", "final_query_dq": "Skipped"}
-     }, {
-         "output_percentage": 0.0,
-         "success_percentage": 0.0,
-         "error_percentage": 100.0,
-     }),
-    ({
-         "input_count": 100,
-         "error_count": 100,
-         "output_count": 0,
-         "source_agg_results": [
-             {"rule_name": "rule2", "action_if_failed": "drop", "description": "not null values in col2",
-              "rule_type": "agg_dq"}],
-         "final_agg_results": None,
-         "source_query_dq_results": [
-             {"rule_name": "rule5", "action_if_failed": "ignore", "description": "sum of col5 must be gt 100",
-              "rule_type": "query_dq"}],
-         "final_query_dq_results": [
-             {"rule_name": "rule5", "action_if_failed": "ignore", "description": "sum of col5 must be gt 100",
-              "rule_type": "query_dq"}],
-         "row_dq_res_summary": [
-             {"rule_name": "rule1", "action_if_failed": "ignore", "rule_type": "row_dq", "failed_count": 100},
-             {"rule_name": "rule2", "action_if_failed": "drop", "rule_type": "row_dq", "failed_count": 100},
-             {"rule_name": "rule3", "action_if_failed": "ignore", "rule_type": "row_dq", "failed_count": 88}],
-         "row_dq_error_threshold": [
-             {"rule_name": "rule1", "action_if_failed": "ignore", "description": "description1",
-              "rule_type": "row_dq", "error_drop_threshold": "15", "error_drop_percentage": "100.0"},
-             {"rule_name": "rule2", "action_if_failed": "drop", "description": "description2",
-              "rule_type": "row_dq", "error_drop_threshold": "10", "error_drop_percentage": "100.0"},
-             {"rule_name": "rule3", "action_if_failed": "ignore", "description": "description3",
-              "rule_type": "row_dq", "error_drop_threshold": "5", "error_drop_percentage": "88.0"}
-         ],
-         "dq_run_time": {"final_query_dq_run_time": 22.7, "source_agg_dq_run_time": 0.0, "row_dq_run_time": 29.3,
-                         "source_query_dq_run_time": 10.8, "final_agg_dq_run_time": 0.0, "run_time": 108.5},
-         "dq_rules": {"rules": {"num_dq_rules": 18, "num_row_dq_rules": 8},
-                      "query_dq_rules": {"num_final_query_dq_rules": 6, "num_source_query_dq_rules": 5,
-                                         "num_query_dq_rules": 3},
-                      "agg_dq_rules": {"num_source_agg_dq_rules": 4, "num_agg_dq_rules": 4,
-                                       "num_final_agg_dq_rules": 3}},
-         "status": {"run_status": "Failed", "source_agg_dq": "Passed", "row_dq": "Passed", "final_agg_dq": "Failed",
-                    "source_query_dq": "Passed", "final_query_dq": "Passed"}
-     }, {
-         "output_percentage": 0.0,
-         "success_percentage": 0.0,
-         "error_percentage": 100.0
-     }),
-    ({
-         "input_count": 100,
-         "error_count": 100,
-         "output_count": 0,
-         "source_agg_results": None,
-         "final_agg_results": None,
-         "source_query_dq_results": None,
-         "final_query_dq_results": None,
-         "row_dq_res_summary": [
-             {"rule_name": "rule1", "action_if_failed": "ignore", "rule_type": "row_dq", "failed_count": 100},
-             {"rule_name": "rule2", "action_if_failed": "drop", "rule_type": "row_dq", "failed_count": 100},
-             {"rule_name": "rule3", "action_if_failed": "ignore", "rule_type": "row_dq", "failed_count": 88},
-             {"rule_name": "rule4", "action_if_failed": "fail", "rule_type": "row_dq", "failed_count": 60}],
-         "row_dq_error_threshold": [
-             {"rule_name": "rule1", "action_if_failed": "ignore", "description": "description1",
-              "rule_type": "row_dq", "error_drop_threshold": "15", "error_drop_percentage": "100.0"},
-             {"rule_name": "rule2", "action_if_failed": "drop", "description": "description2",
-              "rule_type": "row_dq", "error_drop_threshold": "10", "error_drop_percentage": "100.0"},
-             {"rule_name": "rule3", "action_if_failed": "ignore", "description": "description3",
-              "rule_type": "row_dq", "error_drop_threshold": "5", "error_drop_percentage": "88.0"},
-             {"rule_name": "rule4", "action_if_failed": "fail", "description": "description4",
-              "rule_type": "row_dq", "error_drop_threshold": "10", "error_drop_percentage": "60.0"}
-         ],
-         "dq_run_time": {"final_query_dq_run_time": 0.0, "source_agg_dq_run_time": 0.0, "row_dq_run_time": 29.3,
-                         "source_query_dq_run_time": 0.0, "final_agg_dq_run_time": 0.0, "run_time": 108.5},
-         "dq_rules": {"rules": {"num_dq_rules": 23, "num_row_dq_rules": 5},
-                      "query_dq_rules": {"num_final_query_dq_rules": 10, "num_source_query_dq_rules": 5,
-                                         "num_query_dq_rules": 5},
-                      "agg_dq_rules": {"num_source_agg_dq_rules": 8, "num_agg_dq_rules": 4,
-                                       "num_final_agg_dq_rules": 4}},
-         "status": {"run_status": "Failed", "source_agg_dq": "Skipped", "row_dq": "Failed", "final_agg_dq": "Skipped",
-                    "source_query_dq": "Skipped", "final_query_dq": "Skipped"}
-     }, {
-         "output_percentage": 0.0,
-         "success_percentage": 0.0,
-         "error_percentage": 100.0,
-     })
-])
-@patch('spark_expectations.sinks.utils.writer.SparkExpectationsContext', autospec=True, spec_set=True)
-def test_write_error_stats(_mock_context,
-                           input_record,
-                           expected_result,
+class _CtxStub:
+    """
+    Plain stand-in for SparkExpectationsContext, which holds the getters read by write_error_stats as attributes
+    """
+
+    def __init__(self):
+        self.get_se_streaming_stats_dict = {user_config.se_enable_streaming: True}
+
+    def print_dataframe_with_debugger(self, df):
+        pass
+
+
+def _set_context_attributes(context, case_index, input_record, expected_result):
+    # wire the context getters used by write_error_stats for one case
+    attributes = {
+        "get_dq_stats_table_name": "test_dq_stats_table",
+        "get_run_date_name": "meta_dq_run_date",
+        "get_run_date_time_name": "meta_dq_run_datetime",
+        "get_run_date": "2022-12-27 10:39:44",
+        "get_run_id_name": "meta_dq_run_id",
+        "get_run_id": f"product1_run_test_{case_index}",
+        "get_dq_run_status": input_record.get("status").get("run_status"),
+        "get_source_agg_dq_status": input_record.get("status").get("source_agg_dq"),
+        "get_row_dq_status": input_record.get("status").get("row_dq"),
+        "get_final_agg_dq_status": input_record.get("status").get("final_agg_dq"),
+        "get_source_query_dq_status": input_record.get("status").get("source_query_dq"),
+        "get_final_query_dq_status": input_record.get("status").get("final_query_dq"),
+        "get_input_count": input_record.get("input_count"),
+        "get_error_count": input_record.get("error_count"),
+        "get_output_count": input_record.get("output_count"),
+        "get_source_agg_dq_result": input_record.get("source_agg_results"),
+        "get_final_agg_dq_result": input_record.get("final_agg_results"),
+        "get_table_name": "employee_table",
+        "get_output_percentage": expected_result.get("output_percentage"),
+        "get_error_percentage": expected_result.get("error_percentage"),
+        "get_success_percentage": expected_result.get("success_percentage"),
+        "get_env": "local",
+        "get_se_streaming_stats_topic_name": "dq-sparkexpectations-stats",
+        "get_source_query_dq_result": input_record.get("source_query_dq_results"),
+        "get_final_query_dq_result": input_record.get("final_query_dq_results"),
+        "get_summarised_row_dq_res": input_record.get("row_dq_res_summary"),
+        "get_rules_exceeds_threshold": input_record.get("row_dq_error_threshold"),
+        "get_dq_run_time": round(input_record.get("dq_run_time").get("run_time"), 1),
+        "get_source_agg_dq_run_time": round(input_record.get("dq_run_time").get("source_agg_dq_run_time"), 1),
+        "get_source_query_dq_run_time": round(input_record.get("dq_run_time").get("source_query_dq_run_time"), 1),
+        "get_row_dq_run_time": round(input_record.get("dq_run_time").get("row_dq_run_time"), 1),
+        "get_final_agg_dq_run_time": round(input_record.get("dq_run_time").get("final_agg_dq_run_time"), 1),
+        "get_final_query_dq_run_time": round(input_record.get("dq_run_time").get("final_query_dq_run_time"), 1),
+        "get_num_row_dq_rules": input_record.get("dq_rules").get("rules").get("num_row_dq_rules"),
+        "get_num_dq_rules": input_record.get("dq_rules").get("rules").get("num_dq_rules"),
+        "get_num_agg_dq_rules": input_record.get("dq_rules").get("agg_dq_rules"),
+        "get_num_query_dq_rules": input_record.get("dq_rules").get("query_dq_rules"),
+    }
+    for name, value in attributes.items():
+        setattr(context, name, value)
+
+
+def test_write_error_stats(spark,
+                           _fixture_write_stats_cases,
                            _fixture_create_stats_table,
                            _fixture_local_kafka_topic):
-    # create mock _context object
-    setattr(_mock_context, "get_dq_stats_table_name", "test_dq_stats_table")
-    setattr(_mock_context, "get_run_date_name", "meta_dq_run_date")
-    setattr(_mock_context, "get_run_date_time_name", "meta_dq_run_datetime")
-    setattr(_mock_context, "get_run_date", "2022-12-27 10:39:44")
-    setattr(_mock_context, "get_run_id_name", "meta_dq_run_id")
-    setattr(_mock_context, "get_run_id", "product1_run_test")
-    setattr(_mock_context, "get_dq_run_status", input_record.get("status").get("run_status"))
-    setattr(_mock_context, "get_source_agg_dq_status", input_record.get("status").get("source_agg_dq"))
-    setattr(_mock_context, "get_row_dq_status", input_record.get("status").get("row_dq"))
-    setattr(_mock_context, "get_final_agg_dq_status", input_record.get("status").get("final_agg_dq"))
-    setattr(_mock_context, "get_source_query_dq_status", input_record.get("status").get("source_query_dq"))
-    setattr(_mock_context, "get_final_query_dq_status", input_record.get("status").get("final_query_dq"))
-    setattr(_mock_context, "get_input_count", input_record.get("input_count"))
-    setattr(_mock_context, "get_error_count", input_record.get("error_count"))
-    setattr(_mock_context, "get_output_count", input_record.get("output_count"))
-    setattr(_mock_context, "get_source_agg_dq_result", input_record.get("source_agg_results"))
-    setattr(_mock_context, "get_final_agg_dq_result", input_record.get("final_agg_results"))
-    setattr(_mock_context, "get_table_name", "employee_table")
-    setattr(_mock_context, "get_output_percentage",
-            round((input_record.get("output_count") / input_record.get("input_count")) * 100, 2))
-    setattr(_mock_context, "get_error_percentage",
-            round((input_record.get("error_count") / input_record.get("input_count")) * 100, 2))
-    setattr(_mock_context, "get_success_percentage",
-            round(((input_record.get("input_count") - input_record.get("error_count")) /
-                   input_record.get("input_count")) * 100, 2))
-    setattr(_mock_context, "get_env", "local")
-    setattr(_mock_context, "get_se_streaming_stats_topic_name", "dq-sparkexpectations-stats")
-    setattr(_mock_context, "get_source_query_dq_result", input_record.get("source_query_dq_results"))
-    setattr(_mock_context, "get_final_query_dq_result", input_record.get("final_query_dq_results"))
-    setattr(_mock_context, "get_summarised_row_dq_res", input_record.get("row_dq_res_summary"))
-    setattr(_mock_context, "get_rules_exceeds_threshold", input_record.get("row_dq_error_threshold"))
-
-    setattr(_mock_context, "get_dq_run_time", round(input_record.get("dq_run_time").get("run_time"), 1))
-    setattr(_mock_context, "get_source_agg_dq_run_time",
-            round(input_record.get("dq_run_time").get("source_agg_dq_run_time"), 1))
-    setattr(_mock_context, "get_source_query_dq_run_time",
-            round(input_record.get("dq_run_time").get("source_query_dq_run_time"), 1))
-    setattr(_mock_context, "get_row_dq_run_time", round(input_record.get("dq_run_time").get("row_dq_run_time"), 1))
-    setattr(_mock_context, "get_final_agg_dq_run_time",
-            round(input_record.get("dq_run_time").get("final_agg_dq_run_time"), 1))
-    setattr(_mock_context, "get_final_query_dq_run_time",
-            round(input_record.get("dq_run_time").get("final_query_dq_run_time"), 1))
-
-    setattr(_mock_context, "get_num_row_dq_rules",
-            input_record.get("dq_rules").get("rules").get("num_row_dq_rules"))
-    setattr(_mock_context, "get_num_dq_rules",
-            input_record.get("dq_rules").get("rules").get("num_dq_rules"))
-    setattr(_mock_context, "get_num_agg_dq_rules",
-            input_record.get("dq_rules").get("agg_dq_rules"))
-    setattr(_mock_context, "get_num_query_dq_rules",
-            input_record.get("dq_rules").get("query_dq_rules"))
-
-    _fixture_writer = SparkExpectationsWriter("product1", _mock_context)
-
-    # Call the function being tested with some test input data
-    _fixture_writer.write_error_stats()
+    # one writer is shared by all the cases, only the context attributes change between them
+    _context = _CtxStub()
+    writer = SparkExpectationsWriter("product1", _context)
+
+    # every case is written with its own run id, so that the stats table and the kafka topic are read back once
+    for case_index, (input_record, expected_result) in enumerate(_fixture_write_stats_cases):
+        _set_context_attributes(_context, case_index, input_record, expected_result)
+
+        # Call the function being tested with some test input data
+        writer.write_error_stats()
 
     # Assert
-    stats_table = spark.table("test_dq_stats_table")
-    assert stats_table.count() == 1
-    row = stats_table.first()
-    assert row.product_id == "product1"
-    assert row.table_name == "employee_table"
-    assert row.input_count == input_record.get("input_count")
-    assert row.error_count == input_record.get("error_count")
-    assert row.output_count == input_record.get("output_count")
-    assert row.output_percentage == expected_result.get("output_percentage")
-    assert row.success_percentage == expected_result.get("success_percentage")
-    assert row.error_percentage == expected_result.get("error_percentage")
-    assert row.source_agg_dq_results == input_record.get("source_agg_results")
-    assert row.final_agg_dq_results == input_record.get("final_agg_results")
-    assert row.source_query_dq_results == input_record.get("source_query_dq_results")
-    assert row.final_query_dq_results == input_record.get("final_query_dq_results")
-    assert row.dq_rules == input_record.get("dq_rules")
-    # assert row.dq_run_time == input_record.get("dq_run_time")
-    assert row.dq_status == input_record.get("status")
-    assert row.meta_dq_run_id == "product1_run_test"
-
-    assert spark.read.format("kafka").option(
+    # a single read of the stats table, which also carries the json form of each row for the kafka comparison
+    rows = {row.meta_dq_run_id: row for row in spark.table("test_dq_stats_table").selectExpr(
+        "*", "to_json(struct(*)) AS stats_json").collect()}
+    assert len(rows) == len(_fixture_write_stats_cases)
+    for case_index, (input_record, expected_result) in enumerate(_fixture_write_stats_cases):
+        row = rows[f"product1_run_test_{case_index}"]
+        assert row.product_id == "product1"
+        assert row.table_name == "employee_table"
+        assert row.input_count == input_record.get("input_count")
+        assert row.error_count == input_record.get("error_count")
+        assert row.output_count == input_record.get("output_count")
+        assert row.output_percentage == expected_result.get("output_percentage")
+        assert row.success_percentage == expected_result.get("success_percentage")
+        assert row.error_percentage == expected_result.get("error_percentage")
+        assert row.source_agg_dq_results == input_record.get("source_agg_results")
+        assert row.final_agg_dq_results == input_record.get("final_agg_results")
+        assert row.source_query_dq_results == input_record.get("source_query_dq_results")
+        assert row.final_query_dq_results == input_record.get("final_query_dq_results")
+        assert row.dq_rules == input_record.get("dq_rules")
+        # assert row.dq_run_time == input_record.get("dq_run_time")
+        assert row.dq_status == input_record.get("status")
+
+    # the latest messages of the topic are the stats of the cases above
+    assert sorted(record.value for record in spark.read.format("kafka").option(
         "kafka.bootstrap.servers", "localhost:9092"
     ).option("subscribe", "dq-sparkexpectations-stats").option(
         "startingOffsets", "earliest"
     ).option(
         "endingOffsets", "latest"
-    ).load().orderBy(col('timestamp').desc()).limit(1).selectExpr(
-        "cast(value as string) as value").collect() == stats_table.selectExpr(
-        "to_json(struct(*)) AS value").collect()
+    ).load().orderBy(col('timestamp').desc(), col('offset').desc()).limit(len(_fixture_write_stats_cases)).selectExpr(
+        "cast(value as string) as value").collect()) == sorted(row.stats_json for row in rows.values())
 
     # Assert spark conf.set
     # _spark_set.assert_called_with('spark.sql.session.timeZone', 'Etc/UTC')
 
 
+@patch('spark_expectations.sinks.utils.writer._kafka_sink_hook', autospec=True, spec_set=True)
+def test_buffer_stats(_mock_kafka_sink_hook, spark, _fixture_writer):
+    stats_df = spark.createDataFrame([("product1", 100)], _stats_schema)
+    kafka_write_options = {"kafka.bootstrap.servers": "localhost:9092", "topic": "dq-sparkexpectations-stats"}
+
+    _fixture_writer.buffer_stats(stats_df, kafka_write_options, buffer_size=2)
+    _mock_kafka_sink_hook.assert_not_called()
+
+    # the buffer is flushed into kafka as a single batch once it is full
+    _fixture_writer.buffer_stats(stats_df, kafka_write_options, buffer_size=2)
+    _mock_kafka_sink_hook.assert_called_once()
+
+    _write_args = _mock_kafka_sink_hook.call_args.kwargs["_write_args"]
+    assert _write_args["stats_df"].count() == 2
+    assert _write_args["kafka_write_options"] == {**kafka_write_options,
+                                                  "kafka.linger.ms": "100",
+                                                  "kafka.batch.size": "64000"}
+    assert _fixture_writer._stats_buffer == []
+
+    # nothing is written when the buffer is empty
+    _fixture_writer.flush_stats_buffer()
+    _mock_kafka_sink_hook.assert_called_once()
+
+
+@patch('spark_expectations.sinks.utils.writer._kafka_sink_hook', autospec=True, spec_set=True)
+def test_write_error_stats_buffered(_mock_kafka_sink_hook,
+                                    spark,
+                                    _fixture_write_stats_cases,
+                                    _fixture_create_stats_table):
+    _context = _CtxStub()
+    _context.get_se_streaming_stats_dict = {user_config.se_enable_streaming: True,
+                                            user_config.se_buffer_stats_writes: True,
+                                            user_config.se_buffer_stats_writes_size: 2}
+    _writer = SparkExpectationsWriter("product1", _context)
+    input_record, expected_result = _fixture_write_stats_cases[0]
+    _set_context_attributes(_context, 0, input_record, expected_result)
+
+    _writer.write_error_stats()
+
+    # the stats table is written right away, while the kafka write is held back in the buffer
+    assert spark.table("test_dq_stats_table").count() == 1
+    _mock_kafka_sink_hook.assert_not_called()
+    assert len(_writer._stats_buffer) == 1
+
+    _writer.flush_stats_buffer()
+
+    _mock_kafka_sink_hook.assert_called_once()
+    assert _mock_kafka_sink_hook.call_args.kwargs["_write_args"]["stats_df"].count() == 1
+    assert _writer._stats_buffer == []
+
+
+@patch('spark_expectations.sinks.utils.writer._kafka_sink_hook', autospec=True, spec_set=True)
+def test_flush_stats_buffer_exception(_mock_kafka_sink_hook, spark, _fixture_writer):
+    _mock_kafka_sink_hook.side_effect = Exception("kafka is not reachable")
+    _fixture_writer._stats_buffer = [spark.createDataFrame([("product1", 100)], _stats_schema)]
+
+    with pytest.raises(SparkExpectationsMiscException,
+                       match=r"error occurred while writing buffered stats into the kafka topic .*"):
+        _fixture_writer.flush_stats_buffer()
+
+
 @pytest.mark.parametrize('table_name, rule_type, spark_conf, options',
-                         [('test_error_table',
-                           'row_dq',
-                           {"spark.sql.session.timeZone": "Etc/UTC"},
-                           {'mode': 'overwrite', "format": "delta"}
-                           )
+                         [('test_error_table', 'row_dq', {"spark.sql.session.timeZone": "Etc/UTC"},
+                           {'mode': 'overwrite', "format": "delta"}),
+                          ('test_error_table', 'row_dq', {"spark.sql.session.timeZone": "Etc/UTC"},
+                           {'mode': 'append', "format": "delta", "mergeSchema": "true"})
                           ])
-def test_write_error_records_final(table_name,
+@patch('spark_expectations.sinks.utils.writer.SparkExpectationsWriter.save_df_as_table', autospec=True, spec_set=True)
+def test_write_error_records_final(save_df_as_table,
+                                   table_name,
                                    rule_type,
                                    spark_conf,
                                    options,
                                    _fixture_dq_dataset,
-                                   _fixture_expected_dq_dataset,
                                    _fixture_writer):
-    # invoke the write_error_records_final method with the test fixtures as arguments
+    # the error table is not read back here, so the table write is patched out, test_save_df_as_table covers it
     result, _df = _fixture_writer.write_error_records_final(_fixture_dq_dataset,
                                                             table_name,
                                                             rule_type,
                                                             spark_conf,
                                                             options)
-    # error_df = spark.table("test_error_table")
 
     # assert that the returned value is the expected number of rows in the error table
-    _df = _df.withColumn("meta_dq_run_date", to_timestamp(lit("2022-12-27 10:39:44")))
     assert result == 3
-    assert _df.count() == 4
-    assert _df.orderBy("id").collect() == _fixture_expected_dq_dataset.orderBy("id").collect()
+    assert _df.orderBy("id").collect() == _expected_dq_rows
 
+    # only the error records are written into the error table, with the given table name, conf and options
+    save_df_args = save_df_as_table.call_args
+    assert save_df_args[0][1].orderBy("id").collect() == _expected_error_rows
+    save_df_as_table.assert_called_once_with(_fixture_writer, save_df_args[0][1], table_name, spark_conf, options)
 
-@pytest.mark.parametrize('table_name, rule_type, spark_conf, options',
-                         [('test_error_table', 'row_dq', {"spark.sql.session.timeZone": "Etc/UTC"},
-                           {'mode': 'overwrite', "format": "delta"})
-                          ])
-@patch('spark_expectations.sinks.utils.writer.SparkExpectationsWriter.save_df_as_table', autospec=True, spec_set=True)
-def test_write_error_records_final_dependent(save_df_as_table,
-                                             table_name,
-                                             rule_type,
-                                             spark_conf,
-                                             options,
-                                             _fixture_dq_dataset,
-                                             _fixture_expected_error_dataset,
-                                             _fixture_writer):
-    # invoke the write_error_records_final method with the test fixtures as arguments
-    result, _df = _fixture_writer.write_error_records_final(_fixture_dq_dataset,
-                                                            table_name,
-                                                            rule_type,
-                                                            spark_conf,
-                                                            options)
 
-    # assert that the returned value is the expected number of rows in the error table
-    assert result == 3
+@patch('spark_expectations.sinks.utils.writer.SparkExpectationsWriter.save_df_as_table', autospec=True, spec_set=True)
+def test_write_error_records_final_persists_error_records(save_df_as_table, _fixture_dq_dataset, _fixture_writer):
+    with patch.object(DataFrame, "persist", autospec=True, side_effect=DataFrame.persist) as _persist, \
+            patch.object(DataFrame, "unpersist", autospec=True, side_effect=DataFrame.unpersist) as _unpersist:
+        _fixture_writer.write_error_records_final(_fixture_dq_dataset,
+                                                  "test_error_table",
+                                                  "row_dq",
+                                                  {"spark.sql.session.timeZone": "Etc/UTC"},
+                                                  {'mode': 'overwrite', "format": "delta"})
 
-    # Assert
-    save_df_args = save_df_as_table.call_args
-    assert save_df_args[0][0] == _fixture_writer
-    assert save_df_args[0][1].orderBy("id").collect() == _fixture_expected_error_dataset \
-        .withColumn("meta_dq_run_date", lit("2022-12-27 10:39:44")) \
-        .orderBy("id").collect()
-    assert save_df_args[0][2] == table_name
-    assert save_df_args[0][3] == spark_conf
-    assert save_df_args[0][4] == options
-    save_df_as_table.assert_called_once_with(_fixture_writer, save_df_args[0][1], table_name, spark_conf, options)
+    # the error records are persisted for the table write, the count and the summary, and released afterwards
+    _persist.assert_called_once()
+    _error_df = _persist.call_args[0][0]
+    assert _error_df is save_df_as_table.call_args[0][1]
+    _unpersist.assert_called_once_with(_error_df)
+    assert not _error_df.is_cached
 
 
 @pytest.mark.parametrize("test_data, expected_result", [
@@ -609,14 +532,24 @@ def test_write_error_records_final_dependent(save_df_as_table,
             [
                 {"rule": "rule1", "failed_row_count": "2"},
             ]
+    ),
+    (
+            [
+                {"meta_row_dq_results": [{"rule": "rule2"}]},
+                {"meta_row_dq_results": [{"rule": "rule1"}, {"rule": "rule2"}]},
+            ],
+            [
+                {"rule": "rule1", "failed_row_count": "1"},
+                {"rule": "rule2", "failed_row_count": "2"},
+            ]
     )
 ])
-def test_generate_summarised_row_dq_res(test_data, expected_result):
+def test_generate_summarised_row_dq_res(spark, test_data, expected_result):
     context = SparkExpectationsContext("product1")
     writer = SparkExpectationsWriter("product1", context)
 
     # Create test DataFrame
-    test_df = spark.createDataFrame(test_data)
+    test_df = spark.createDataFrame(test_data, _summarised_row_dq_schema)
 
     # Call the function under test
     writer.generate_summarised_row_dq_res(test_df, "row_dq")
@@ -778,26 +711,24 @@ def test_generate_rules_exceeds_threshold(dq_rules,
                                           summarised_row_dq,
                                           expected_result,
                                           ):
-    _context = SparkExpectationsContext("product1")
+    # only the context properties read by generate_rules_exceeds_threshold are needed
+    _context = MagicMock()
+    _context.get_summarised_row_dq_res = summarised_row_dq
+    _context.get_input_count = 100
+    _context.get_row_dq_rule_type_name = "row_dq"
     _writer = SparkExpectationsWriter("product1", _context)
-    _context.set_summarised_row_dq_res(summarised_row_dq)
-    _context.set_input_count(100)
 
     # Check the results
     _writer.generate_rules_exceeds_threshold(dq_rules)
-    assert _context.get_rules_exceeds_threshold == expected_result
+    if expected_result is None:
+        _context.set_rules_exceeds_threshold.assert_not_called()
+    else:
+        _context.set_rules_exceeds_threshold.assert_called_once_with(expected_result)
 
-@pytest.mark.parametrize("test_data", [
-    (
-            [
-                {"row_dq_results": [{"rule": "rule1"}, {"rule": "rule2"}]},
-                {"row_dq_results": [{"rule": "rule1"}, {"rule": "rule2"}]}
-            ]
-    ),
-])
-def test_generate_summarised_row_dq_res_exception(test_data, _fixture_writer):
-    # Create test DataFrame
-    test_df = spark.createDataFrame(test_data)
+def test_generate_summarised_row_dq_res_exception(_fixture_writer):
+    # the error dataframe is mocked, its select fails like it does when the rule results column is missing
+    test_df = MagicMock(spec=DataFrame)
+    test_df.select.side_effect = Exception("cannot resolve 'meta_row_dq_results'")
 
     with pytest.raises(SparkExpectationsMiscException,
                        match=r"error occurred created summarised row dq statistics .*"):
@@ -805,33 +736,31 @@ def test_generate_summarised_row_dq_res_exception(test_data, _fixture_writer):
         _fixture_writer.generate_summarised_row_dq_res(test_df, "row_dq")
 
 
-def test_save_df_as_table_exception(_fixture_employee,
+def test_save_df_as_table_exception(_fixture_single_row_df,
                                     _fixture_writer):
     with pytest.raises(SparkExpectationsUserInputOrConfigInvalidException,
                        match=r"error occurred while writing data in to the table .*"):
-        _fixture_writer.save_df_as_table(_fixture_employee, "employee_table",
+        _fixture_writer.save_df_as_table(_fixture_single_row_df, "employee_table",
                                          {"spark.sql.session.timeZone": "Etc/UTC"},
                                          {'mode': 'insert', "format": "test", "mergeSchema": "true"})
 
 
-def test_write_df_to_table_exception(_fixture_employee,
+def test_write_df_to_table_exception(_fixture_single_row_df,
                                      _fixture_writer):
     with pytest.raises(SparkExpectationsMiscException,
                        match=r"error occurred while writing data in to the table .*"):
-        _fixture_writer.write_df_to_table(_fixture_employee, "employee_table", options={'mode': 'insert',
-                                                                                        "format": "test",
-                                                                                        "mergeSchema": "true"})
+        _fixture_writer.write_df_to_table(_fixture_single_row_df, "employee_table", options={'mode': 'insert',
+                                                                                             "format": "test",
+                                                                                             "mergeSchema": "true"})
 
 
-def test_write_error_stats_exception(_fixture_employee,
-                                     _fixture_writer):
+def test_write_error_stats_exception(_fixture_writer):
     with pytest.raises(SparkExpectationsMiscException,
                        match=r"error occurred while saving the data into the stats table .*"):
         _fixture_writer.write_error_stats()
 
 
-def test_write_error_records_final_exception(_fixture_employee,
-                                             _fixture_writer,
+def test_write_error_records_final_exception(_fixture_writer,
                                              _fixture_dq_dataset):
     with pytest.raises(SparkExpectationsMiscException,
                        match=r"error occurred while saving data into the final error table .*"):
@@ -998,20 +998,21 @@ def test_action_on_dq_rules(_mock_set_row_dq_status, _mock_set_source_agg_dq_sta
 
     else:
         # assert when all condition passes without action_if_failed "fail"
-        df = SparkExpectationsActions.action_on_rules(_fixture_mock_context,
-                                                      input_df,
-                                                      table_name,
-                                                      input_count,
-                                                      error_count,
-                                                      output_count,
-                                                      rule_type,
-                                                      row_dq_flag,
-                                                      source_agg_flag,
-                                                      final_agg_flag
-                                                      )
+        df, _output_count = SparkExpectationsActions.action_on_rules(_fixture_mock_context,
+                                                                     input_df,
+                                                                     table_name,
+                                                                     input_count,
+                                                                     error_count,
+                                                                     output_count,
+                                                                     rule_type,
+                                                                     row_dq_flag,
+                                                                     source_agg_flag,
+                                                                     final_agg_flag
+                                                                     )
         if row_dq_flag is True:
             # assert for row dq expectations
             assert df.orderBy("col2").collect() == expected_output.orderBy("col2").collect()
+            assert _output_count == expected_output.count()
         else:
             # assert for agg dq expectations
             assert df.collect() == expected_output.collect()
@@ -1085,6 +1086,28 @@ def test_action_on_rules_exception(input_df,
                                                  row_dq_flag)
 
 
+def test_action_on_rules_output_count_with_null_actions(_fixture_mock_context):
+    # the output count and the records kept agree, also for the records without a list of actions
+    input_df = spark.createDataFrame(
+        [
+            (1, "a", [{"action_if_failed": "drop"}]),
+            (2, "b", [{"action_if_failed": "ignore"}]),
+            (3, "c", None),
+        ],
+        "col1 int, col2 string, meta_row_dq_results array<map<string, string>>",
+    )
+
+    df, _output_count = SparkExpectationsActions.action_on_rules(_fixture_mock_context,
+                                                                 input_df,
+                                                                 "test_dq_stats",
+                                                                 3,
+                                                                 _rule_type="row_dq",
+                                                                 _row_dq_flag=True)
+
+    assert _output_count == df.count()
+    assert [row.col2 for row in df.orderBy("col2").collect()] == ["b"]
+
+
 def test_run_dq_rules_condition_expression_exception(_fixture_df,
                                                      _fixture_query_dq_expected_result,
                                                      _fixture_mock_context):